@@ -0,0 +1,134 @@
+"""
+HTTP/1.1（uvicorn）与 HTTP/2（Hypercorn h2c）并发动作请求负载对比
+
+服务端为与 OneBot CAI HTTP 连接方式相同的 FastAPI 路由，动作处理为等待固定延迟后
+返回固定响应，以模拟需要等待 QQ 服务器的动作；仅测量连接与协议开销。
+
+需要安装 http2 额外依赖及 h2（httpx 的 HTTP/2 支持）：
+    pip install hypercorn h2
+
+用法：python benchmarks/http2_load.py [请求数] [并发数] [动作延迟毫秒]
+"""
+import sys
+import asyncio
+import logging
+from time import perf_counter
+
+import httpx
+from fastapi import FastAPI
+from uvicorn import Config, Server
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HypercornConfig
+
+RESPONSE = {
+    "status": "ok",
+    "retcode": 0,
+    "data": {
+        "impl": "onebot_cai",
+        "platform": "qq",
+        "version": "0.1.0",
+        "onebot_version": "12",
+    },
+    "message": "",
+}
+UVICORN_PORT = 15700
+HYPERCORN_PORT = 15701
+
+app = FastAPI()
+delay = 0.0
+
+
+@app.post("/")
+async def root(data: dict):
+    await asyncio.sleep(delay)
+    return dict(RESPONSE, echo=data.get("echo"))
+
+
+async def bench(
+    url: str, count: int, concurrency: int, http2: bool, connections: int
+):
+    limits = httpx.Limits(
+        max_connections=connections, max_keepalive_connections=connections
+    )
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        http1=not http2, http2=http2, limits=limits, timeout=None
+    ) as client:
+
+        async def request(i: int):
+            async with semaphore:
+                start = perf_counter()
+                response = await client.post(
+                    url, json={"action": "get_version", "echo": str(i)}
+                )
+                response.raise_for_status()
+                latencies.append(perf_counter() - start)
+
+        start = perf_counter()
+        await asyncio.gather(*[request(i) for i in range(count)])
+        elapsed = perf_counter() - start
+
+    latencies.sort()
+    return (
+        count / elapsed,
+        latencies[len(latencies) // 2] * 1e3,
+        latencies[int(len(latencies) * 0.99)] * 1e3,
+    )
+
+
+async def main(count: int, concurrency: int):
+    logging.disable(logging.INFO)
+    uvicorn_server = Server(
+        Config(app=app, port=UVICORN_PORT, log_level="warning")
+    )
+    uvicorn_server.install_signal_handlers = lambda: None  # type: ignore
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.bind = [f"127.0.0.1:{HYPERCORN_PORT}"]
+    hypercorn_exit = asyncio.Event()
+    tasks = [
+        asyncio.create_task(uvicorn_server.serve()),
+        asyncio.create_task(
+            serve(
+                app,  # type: ignore
+                hypercorn_config,
+                shutdown_trigger=hypercorn_exit.wait,  # type: ignore
+            )
+        ),
+    ]
+    await asyncio.sleep(1)
+
+    print(f"{count} 次动作请求，{concurrency} 并发，动作延迟 {delay * 1e3:.0f} 毫秒")
+    for name, port, http2, connections in (
+        ("uvicorn HTTP/1.1 单连接", UVICORN_PORT, False, 1),
+        (
+            f"uvicorn HTTP/1.1 {concurrency} 连接",
+            UVICORN_PORT,
+            False,
+            concurrency,
+        ),
+        ("Hypercorn h2c 单连接", HYPERCORN_PORT, True, 1),
+    ):
+        rps, p50, p99 = await bench(
+            f"http://127.0.0.1:{port}/", count, concurrency, http2, connections
+        )
+        print(
+            f"{name:<24}{rps:10.0f} 次/秒  "
+            f"p50 {p50:7.2f} 毫秒  p99 {p99:7.2f} 毫秒"
+        )
+
+    uvicorn_server.should_exit = True
+    hypercorn_exit.set()
+    await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    delay = (int(args[2]) if len(args) > 2 else 20) / 1000
+    asyncio.run(
+        main(
+            int(args[0]) if len(args) > 0 else 5000,
+            int(args[1]) if len(args) > 1 else 64,
+        )
+    )
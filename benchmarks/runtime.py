@@ -0,0 +1,162 @@
+"""
+运行时对比：asyncio + h11 与 uvloop + httptools
+
+每种运行时在独立子进程中测量：
+动作吞吐量 为 HTTP 连接方式下并发动作请求的每秒请求数（uvicorn，动作直接返回固定响应）
+事件延迟 为反向 WebSocket 连接方式下事件从入队到应用端收到的时间
+
+需要安装 speedups 额外依赖：pip install uvloop httptools
+
+用法：python benchmarks/runtime.py [请求数] [事件数]
+"""
+import sys
+import json
+import asyncio
+import subprocess
+from time import perf_counter
+from importlib.util import find_spec
+
+import httpx
+from fastapi import FastAPI
+from uvicorn import Config, Server
+from websockets.legacy.server import serve
+from websockets.legacy.client import connect
+
+RESPONSE = {
+    "status": "ok",
+    "retcode": 0,
+    "data": {
+        "impl": "onebot_cai",
+        "platform": "qq",
+        "version": "0.1.0",
+        "onebot_version": "12",
+    },
+    "message": "",
+}
+HTTP_PORT = 15710
+CONCURRENCY = 64
+
+app = FastAPI()
+
+
+@app.post("/")
+async def root(data: dict):
+    return dict(RESPONSE, echo=data.get("echo"))
+
+
+async def bench_actions(count: int, http_impl: str) -> float:
+    server = Server(
+        Config(app=app, port=HTTP_PORT, http=http_impl, log_level="warning")
+    )
+    server.install_signal_handlers = lambda: None  # type: ignore
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    limits = httpx.Limits(max_connections=CONCURRENCY)
+    async with httpx.AsyncClient(limits=limits) as client:
+
+        async def request(i: int):
+            async with semaphore:
+                await client.post(
+                    f"http://127.0.0.1:{HTTP_PORT}/",
+                    json={"action": "get_version", "echo": str(i)},
+                )
+
+        start = perf_counter()
+        await asyncio.gather(*[request(i) for i in range(count)])
+        elapsed = perf_counter() - start
+
+    server.should_exit = True
+    await task
+    return count / elapsed
+
+
+async def bench_events(count: int) -> float:
+    """与反向 WebSocket 相同：OneBot CAI 作为客户端向应用端推送 JSON 事件"""
+    latencies = []
+    received = asyncio.Event()
+
+    async def handler(websocket, path):
+        async for message in websocket:
+            latencies.append(perf_counter() - json.loads(message)["time"])
+            received.set()
+
+    server = await serve(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]  # type: ignore
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async with connect(f"ws://127.0.0.1:{port}") as websocket:
+
+        async def send():
+            while True:
+                await websocket.send(await queue.get())
+
+        sender = asyncio.create_task(send())
+        # 逐个推送，避免测得的是排队时间
+        for i in range(count):
+            received.clear()
+            event = {"id": str(i), "type": "message", "time": perf_counter()}
+            queue.put_nowait(json.dumps(event))
+            await received.wait()
+        sender.cancel()
+
+    server.close()
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1e6
+
+
+def child(runtime: str, requests: int, events: int):
+    http_impl = "h11"
+    if runtime == "uvloop":
+        import uvloop
+
+        uvloop.install()
+        http_impl = "httptools"
+    loop = asyncio.new_event_loop()
+    rps = loop.run_until_complete(bench_actions(requests, http_impl))
+    latency = loop.run_until_complete(bench_events(events))
+    print(json.dumps({"rps": rps, "latency": latency}))
+
+
+def main(requests: int, events: int):
+    print(f"{requests} 次动作请求（{CONCURRENCY} 并发），{events} 个事件")
+    runtimes = ["asyncio"]
+    if find_spec("uvloop") and find_spec("httptools"):
+        runtimes.append("uvloop")
+    else:
+        print("未安装 uvloop 或 httptools，仅测量 asyncio")
+    for runtime in runtimes:
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--child",
+                runtime,
+                str(requests),
+                str(events),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        name = (
+            "asyncio + h11" if runtime == "asyncio" else "uvloop + httptools"
+        )
+        print(
+            f"{name:<20}动作 {result['rps']:8.0f} 次/秒  "
+            f"事件延迟 p50 {result['latency']:8.1f} μs"
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        args = sys.argv[1:]
+        main(
+            int(args[0]) if len(args) > 0 else 5000,
+            int(args[1]) if len(args) > 1 else 20000,
+        )
@@ -0,0 +1,98 @@
+"""
+send_message 消息段处理开销：50 个消息段的混合消息
+
+对比旧流程与当前流程：
+旧流程为优化前的实现，每个消息段均经 pydantic 解析，get_base_element 再对每个消息段
+`.dict()` 并重新解析，之后按 isinstance 依次判断类型并转换为 CAI Element；
+当前流程中常用消息段直接构造，仅含常用消息段的消息同步转换为 CAI Element，
+其余消息段只解析一次并按 type 分发转换。
+消息段均为无需网络和数据库的类型（文本、提及、表情、戳一戳、提及所有人）。
+
+需要在含有 config.toml 的目录中运行：python benchmarks/segments.py [次数]
+"""
+import sys
+import asyncio
+from time import perf_counter
+
+from cai.client.message_service.models import (
+    AtElement,
+    FaceElement,
+    PokeElement,
+    TextElement,
+    AtAllElement,
+)
+
+from onebot_cai.run import get_client
+from onebot_cai.msg.message import (
+    message_type,
+    dict_to_message,
+    get_base_element,
+)
+from onebot_cai.models.message import (
+    FaceSegment,
+    PokeSegment,
+    TextSegment,
+    MentionSegment,
+    MentionAllSegment,
+)
+
+SEGMENTS = [
+    {"type": "text", "data": {"text": "OneBot CAI 消息段基准测试"}},
+    {"type": "mention", "data": {"user_id": "123456"}},
+    {"type": "qq.face", "data": {"id": 14}},
+    {"type": "qq.poke", "data": {"id": 2, "name": "比心"}},
+    {"type": "mention_all", "data": {}},
+]
+MESSAGE = [SEGMENTS[i % len(SEGMENTS)] for i in range(50)]
+
+
+async def current() -> None:
+    await get_base_element([dict_to_message(i) for i in MESSAGE])
+
+
+def legacy_dict_to_message(raw: dict):
+    """旧流程的 dict_to_message：总是经 pydantic 解析"""
+    return message_type[raw["type"]].parse_obj(raw)
+
+
+async def legacy_get_base_element(messages: list):
+    """旧流程的 get_base_element，仅保留本测试涉及的消息段类型"""
+    from onebot_cai.utils.database import database  # noqa: F401
+
+    elements = []
+    get_client()
+    for i in messages:
+        # 对每个消息段 `.dict()` 并重新解析
+        i = legacy_dict_to_message(i.dict())
+        if isinstance(i, TextSegment):
+            elements.append(TextElement(content=i.data.text))
+        elif isinstance(i, PokeSegment):
+            if 0 <= i.data.id <= 6:
+                elements.append(PokeElement(id=i.data.id))
+        elif isinstance(i, FaceSegment):
+            elements.append(FaceElement(id=i.data.id))
+        elif isinstance(i, MentionSegment):
+            user_id = i.data.user_id
+            elements.append(AtElement(target=int(user_id), display=user_id))
+        elif isinstance(i, MentionAllSegment):
+            elements.append(AtAllElement())
+    return elements or None
+
+
+async def legacy() -> None:
+    await legacy_get_base_element([legacy_dict_to_message(i) for i in MESSAGE])
+
+
+async def main(count: int):
+    print(f"50 个消息段，{count} 次")
+    for name, func in (("旧流程", legacy), ("当前流程", current)):
+        await func()
+        start = perf_counter()
+        for _ in range(count):
+            await func()
+        elapsed = perf_counter() - start
+        print(f"{name:<8}{elapsed / count * 1e6:10.1f} μs/消息")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,109 @@
+"""
+Unix 套接字与回环正向 WebSocket 传输开销对比
+
+服务端为 OneBot CAI 的 Unix 套接字连接方式（onebot_cai.connect.unix）与
+uvicorn 运行的正向 WebSocket 连接方式（onebot_cai.connect.ws），
+请求均为无需登录 QQ 的 get_version 动作，经过完整的准入控制、校验与响应编码流程
+
+需要在含有 config.toml 的目录中运行，且配置中须包含 [unix] 与 [ws]：
+python benchmarks/unix_vs_ws.py [请求数]
+"""
+import sys
+import asyncio
+import logging
+from json import dumps, loads
+from time import perf_counter
+
+import msgpack
+from uvicorn import Config, Server
+from websockets.legacy.client import connect
+
+from onebot_cai.connect import unix
+from onebot_cai.config import config
+
+REQUEST = {
+    "action": "get_version",
+    "params": {},
+    "echo": "",
+}
+
+
+def pack_frame(data: bytes) -> bytes:
+    return len(data).to_bytes(4, "big") + data
+
+
+async def bench_unix(path: str, count: int, use_msgpack: bool) -> float:
+    reader, writer = await asyncio.open_unix_connection(path)
+    start = perf_counter()
+    for i in range(count):
+        request = dict(REQUEST, echo=str(i))
+        payload = (
+            msgpack.packb(request) if use_msgpack else dumps(request).encode()
+        )
+        writer.write(pack_frame(payload))
+        await writer.drain()
+        length = int.from_bytes(await reader.readexactly(4), "big")
+        payload = await reader.readexactly(length)
+        msgpack.unpackb(payload) if use_msgpack else loads(payload)
+    elapsed = perf_counter() - start
+    writer.close()
+    return elapsed
+
+
+async def bench_ws(url: str, count: int, use_msgpack: bool) -> float:
+    headers = {}
+    if token := config.universal.access_token:
+        headers["Authorization"] = f"Bearer {token}"
+    async with connect(url, extra_headers=headers) as websocket:
+        start = perf_counter()
+        for i in range(count):
+            request = dict(REQUEST, echo=str(i))
+            await websocket.send(
+                msgpack.packb(request) if use_msgpack else dumps(request)
+            )
+            payload = await websocket.recv()
+            msgpack.unpackb(payload) if use_msgpack else loads(payload)
+        return perf_counter() - start
+
+
+async def main(count: int):
+    assert config.unix and config.ws, "配置中须包含 [unix] 与 [ws]"
+    logging.disable(logging.INFO)
+    ws_server = Server(
+        Config(
+            app="onebot_cai.connect.ws:app",
+            host=config.ws.host,
+            port=config.ws.port,
+            log_level="warning",
+        )
+    )
+    ws_server.install_signal_handlers = lambda: None  # type: ignore
+    tasks = [
+        asyncio.create_task(unix.run(install_signal_handlers=False)),
+        asyncio.create_task(ws_server.serve()),
+    ]
+    await asyncio.sleep(1)
+
+    path = config.unix.path
+    url = f"ws://{config.ws.host}:{config.ws.port}"
+    print(f"{count} 次请求-响应往返")
+    for use_msgpack in (False, True):
+        name = "MessagePack" if use_msgpack else "JSON"
+        for transport, bench, address in (
+            ("Unix 套接字", bench_unix, path),
+            ("正向 WebSocket", bench_ws, url),
+        ):
+            elapsed = await bench(address, count, use_msgpack)
+            print(
+                f"{transport:<14}{name:<12}"
+                f"{elapsed / count * 1e6:8.1f} μs/次  "
+                f"{count / elapsed:10.0f} 次/秒"
+            )
+
+    unix.stop()
+    ws_server.should_exit = True
+    await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
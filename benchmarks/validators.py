@@ -0,0 +1,66 @@
+"""
+动作请求校验开销：pydantic 与预编译校验函数
+
+每次请求包括动作请求（RequestModel）和动作参数模型两次校验。
+
+需要在含有 config.toml 的目录中运行：python benchmarks/validators.py [次数]
+"""
+import sys
+from time import perf_counter
+
+from onebot_cai.connect.models import RequestModel
+from onebot_cai.utils.validator import compile_validator
+from onebot_cai.models.action import GroupMember, SendMessage
+
+REQUESTS = [
+    (
+        GroupMember,
+        {
+            "action": "get_group_member_info",
+            "params": {"group_id": 123456, "user_id": 654321},
+            "echo": "1",
+        },
+    ),
+    (
+        SendMessage,
+        {
+            "action": "send_message",
+            "params": {
+                "detail_type": "group",
+                "group_id": 123456,
+                "message": [
+                    {"type": "text", "data": {"text": "hello"}},
+                    {"type": "mention", "data": {"user_id": "654321"}},
+                    {"type": "qq.face", "data": {"id": 14}},
+                    {"type": "text", "data": {"text": "world"}},
+                    {"type": "mention_all", "data": {}},
+                ],
+            },
+            "echo": "2",
+        },
+    ),
+]
+
+
+def main(count: int):
+    validate_request = compile_validator(RequestModel)
+    print(f"{count} 次")
+    for model, request in REQUESTS:
+        validate = compile_validator(model)
+        for name, request_func, params_func in (
+            ("pydantic", lambda data: RequestModel(**data), model.parse_obj),
+            ("预编译", validate_request, validate),
+        ):
+            start = perf_counter()
+            for _ in range(count):
+                request_model = request_func(request)
+                params_func(request_model.params)
+            elapsed = perf_counter() - start
+            print(
+                f"{model.__name__:<14}{name:<10}"
+                f"{elapsed / count * 1e6:8.2f} μs/请求"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -7,8 +7,12 @@ if __name__ == "__main__":
 
     from .main import main
     from .log import logger
+    from .config import config
+    from .utils import runtime
 
     logger.info("开始启动 OneBot CAI")
+    runtime.setup_runtime(config.universal.runtime)
+    logger.info(f"运行时：事件循环 {runtime.loop_impl}，HTTP 解析器 {runtime.http_impl}")
 
     loop = get_event_loop()
     status = loop.run_until_complete(main())
@@ -1,39 +1,82 @@
 """OneBot CAI 动作执行模块"""
+import asyncio
 from time import time
 from uuid import UUID
 from base64 import b64decode
 from binascii import Error as B64Error
+from typing import (
+    List,
+    Tuple,
+    TypeVar,
+    Callable,
+    Optional,
+    Sequence,
+    Awaitable,
+)
 
 from cai import Client
+from cai.client.message_service.models import Element
 
 from .log import logger
+from .config import config
 from .run import get_client
 from .run import mute_member
-from .run import delete_group_msg
-from .exception import ParamNotFound
+from .run import resolve_action
+from .utils.metrics import metrics
 from .utils.database import database
+from .utils.ratelimit import RateLimiter
 from .run import get_group_member_info_list
 from .run import set_admin as cai_set_admin
 from .run import get_status as cai_get_status
+from .connect.exception import HTTPClientError
+from .run import collect_actions, delete_group_msg
 from .models.message import Message, DatabaseMessage
 from .run import get_group_info as cai_get_group_info
 from .run import send_group_msg as cai_send_group_msg
-from .msg.message import dict_to_message, get_alt_message
+from .exception import ParamNotFound, SegmentParseError
 from .run import send_private_msg as cai_send_private_msg
 from .const import IMPL, VERSION, PLATFORM, ONEBOT_VERSION
+from .connect.utils import BATCH_CONCURRENCY, run_action_by_dict
 from .run import get_group_member_info as cai_get_group_member_info
-from .connect.status import STATUS, OKInfo, FailedInfo, SuccessRequest
 from .models.others import File, FileID, SelfInfo, SentMessage, VersionInfo
 from .run import delete_private_msg, get_group_info_list, get_friend_info_list
+from .connect.status import (
+    STATUS,
+    OKInfo,
+    FailedInfo,
+    SuccessRequest,
+    TargetResponse,
+)
+from .msg.message import (
+    prepare_media,
+    dict_to_message,
+    get_alt_message,
+    get_base_element,
+)
 from .models.action import (
     User,
+    Batch,
     Group,
     GetFile,
     MessageID,
+    MessageIDs,
     GroupMember,
     SendMessage,
+    GroupMembers,
+    PrepareMedia,
     BanGroupMember,
+    BanGroupMembers,
+    SendMessageMulti,
+)
+
+T = TypeVar("T")
+multi_send_limiter = RateLimiter(
+    5
+    if config.action.multi_send_rate is None
+    else config.action.multi_send_rate
 )
+"""qq.send_message_multi 的发送速率限制，所有请求共用"""
+MULTI_SEND_CONCURRENCY = config.action.multi_send_concurrency or 4
 
 
 async def get_self_info(echo: str):
@@ -64,14 +107,13 @@ async def get_friend_list(echo: str):
     return OKInfo(data=friends, echo=echo)  # type: ignore
 
 
-async def get_user_info(echo: str, **kwargs):
+async def get_user_info(echo: str, data: User):
     """
     获取用户信息
     https://12.onebot.dev/interface/user/actions/#get_user_info
 
     注意：目前仍只能获取好友信息，陌生人信息暂不支持
     """
-    data = User(**kwargs)
     friend = await cai_get_group_info(data.user_id)
     return (
         OKInfo(data=friend, echo=echo)
@@ -82,12 +124,11 @@ async def get_user_info(echo: str, **kwargs):
     )
 
 
-async def get_group_info(echo: str, **kwargs):
+async def get_group_info(echo: str, data: Group):
     """
     获取群信息
     https://12.onebot.dev/interface/group/actions/#get_group_info
     """
-    data = Group(**kwargs)
     group = await cai_get_group_info(data.group_id)
     return (
         OKInfo(data=group, echo=echo)
@@ -107,12 +148,11 @@ async def get_group_list(echo: str):
     return OKInfo(data=groups, echo=echo)  # type: ignore
 
 
-async def get_group_member_info(echo: str, **kwargs):
+async def get_group_member_info(echo: str, data: GroupMember):
     """
     获取群成员信息
     https://12.onebot.dev/interface/group/actions/#get_group_member_info
     """
-    data = GroupMember(**kwargs)
     member = await cai_get_group_member_info(data.group_id, data.user_id)
     if member:
         return OKInfo(data=member, echo=echo)
@@ -122,21 +162,24 @@ async def get_group_member_info(echo: str, **kwargs):
         )
 
 
-async def get_group_member_list(echo: str, **kwargs):
+async def get_group_member_list(echo: str, data: Group):
     """
     获取群成员列表
     https://12.onebot.dev/interface/group/actions/#get_group_member_list
     """
-    data = Group(**kwargs)
     members = await get_group_member_info_list(data.group_id)
     return OKInfo(data=members, echo=echo)  # type: ignore
 
 
 async def _send_group_msg(
-    client: Client, echo: str, group_id: int, message: Message
+    client: Client,
+    echo: str,
+    group_id: int,
+    message: Message,
+    element: Optional[List[Element]] = None,
 ):
     """发送群消息"""
-    result = await cai_send_group_msg(client, group_id, message)
+    result = await cai_send_group_msg(client, group_id, message, element)
     if isinstance(result, tuple):
         message_id = database.save_message(
             DatabaseMessage(
@@ -147,7 +190,8 @@ async def _send_group_msg(
                 group=group_id,
             )
         )
-        alt_message = await get_alt_message(message, group_id=group_id)
+        # 仅用于日志，不获取群成员列表
+        alt_message = await get_alt_message(message)
         logger.info(f"向群 {group_id} 发送消息：{alt_message}")
         return OKInfo(
             data=SentMessage(time=int(time()), message_id=message_id),
@@ -176,9 +220,13 @@ async def _send_group_msg(
 
 
 async def _send_private_msg(
-    client: Client, echo: str, user_id: int, message: Message
+    client: Client,
+    echo: str,
+    user_id: int,
+    message: Message,
+    element: Optional[List[Element]] = None,
 ):
-    result = await cai_send_private_msg(client, user_id, message)
+    result = await cai_send_private_msg(client, user_id, message, element)
     if isinstance(result, tuple):
         message_id = database.save_message(
             DatabaseMessage(
@@ -207,14 +255,12 @@ async def _send_private_msg(
         )
 
 
-async def send_message(client: Client, echo: str, **kwargs):
+async def send_message(client: Client, echo: str, data: SendMessage):
     """
     发送消息
     https://12.onebot.dev/interface/message/actions/#send_message
     """
 
-    data = SendMessage(**kwargs)
-
     raw_message = data.message
     detail_type = data.detail_type
     message = []
@@ -241,14 +287,71 @@ async def send_message(client: Client, echo: str, **kwargs):
     )
 
 
-async def delete_message(client: Client, echo: str, **kwargs):
+async def qq_send_message_multi(
+    client: Client, echo: str, data: SendMessageMulti
+):
+    """
+    扩展动作：向多个群和好友发送同一消息
+
+    group_ids：群号列表
+    user_ids：好友 QQ 号列表
+    message：消息，回复消息段将被忽略
+    concurrency：同时发送的最大数，不超过配置的上限
+
+    消息只转换一次，图片、语音、视频只下载、转码和上传一次，之后向各目标发送。
+    发送速率受配置的 multi_send_rate 限制。
+    按群号、好友 QQ 号的顺序返回各目标的发送结果，格式与 send_message 的响应相同，
+    另含 detail_type 及 group_id 或 user_id，echo 与请求相同
+    """
+    message = []
+    for i in data.message:
+        try:
+            message.append(dict_to_message(i))
+        except ValueError:
+            logger.warning("解析消息段失败，可能是格式不符合")
+    element = await get_base_element(message, True)  # type: ignore
+    if not element:
+        logger.warning("批量发送消息失败：消息为空")
+        return FailedInfo(
+            retcode=10006, message=STATUS[10006], data=None, echo=echo
+        )
+
+    async def send(target: Tuple[str, int]) -> SuccessRequest:
+        await multi_send_limiter.wait()
+        detail_type, id_ = target
+        if detail_type == "group":
+            return await _send_group_msg(
+                client, None, id_, message, element  # type: ignore
+            )
+        return await _send_private_msg(
+            client, None, id_, message, element  # type: ignore
+        )
+
+    targets = [("group", i) for i in data.group_ids]
+    targets.extend(("private", i) for i in data.user_ids)
+    resp = await _run_bulk(
+        targets, send, data.concurrency, MULTI_SEND_CONCURRENCY
+    )
+    # 在各项结果中注明目标，echo 与请求相同
+    resp.data = [
+        TargetResponse.construct(
+            **dict(item.__dict__, echo=echo),
+            detail_type=detail_type,
+            **{"group_id" if detail_type == "group" else "user_id": id_},
+        )
+        for (detail_type, id_), item in zip(targets, resp.data)  # type: ignore
+    ]
+    resp.echo = echo
+    return resp
+
+
+async def delete_message(client: Client, echo: str, data: MessageID):
     # sourcery skip: merge-nested-ifs
     """
     撤回消息
     https://12.onebot.dev/interface/message/actions/#delete_message
     """
 
-    data = MessageID(**kwargs)
     try:
         msg_id = data.message_id
         if msg := database.get_message(msg_id):
@@ -284,19 +387,21 @@ async def delete_message(client: Client, echo: str, **kwargs):
                 message=STATUS[34004],
                 echo=echo,
             )
+        return FailedInfo(
+            retcode=31000, data=None, message=STATUS[31000], echo=echo
+        )
     except ValueError:
         return FailedInfo(
             retcode=10003, echo=echo, message=STATUS[10003], data=None
         )
 
 
-async def qq_get_message(echo: str, **kwargs):
+async def qq_get_message(echo: str, data: MessageID):
     """
     扩展动作：获取消息
 
     message_id 消息 ID
     """
-    data = MessageID(**kwargs)
     msg_id = data.message_id
     if message := database.get_message(msg_id):
         return OKInfo(data=message.msg, echo=echo)
@@ -306,12 +411,39 @@ async def qq_get_message(echo: str, **kwargs):
         )
 
 
-async def get_file(echo: str, **kwargs):
+async def qq_prepare_media(client: Client, echo: str, data: PrepareMedia):
+    """
+    扩展动作：预上传媒体
+
+    file_id：文件 ID
+    type：媒体类型，可为 image、voice、audio 或 video
+
+    下载、转码并上传一次，返回媒体句柄 handle 和过期时间戳 expires。
+    有效期内发送 qq.media 消息段（data 为 {"handle": 媒体句柄}）时直接使用已上传的媒体
+    """
+    try:
+        handle, expires = await prepare_media(data.type, data.file_id, client)
+    except ValueError:  # file_id 不是合法的 UUID
+        return FailedInfo(
+            retcode=10003, echo=echo, message=STATUS[10003], data=None
+        )
+    except SegmentParseError:
+        return FailedInfo(
+            retcode=31001, echo=echo, message=STATUS[31001], data=None
+        )
+    except HTTPClientError as e:
+        logger.warning(f"下载媒体失败：{e}")
+        return FailedInfo(
+            retcode=33000, echo=echo, message=STATUS[33000], data=None
+        )
+    return OKInfo(data={"handle": handle, "expires": expires}, echo=echo)
+
+
+async def get_file(echo: str, data: GetFile):
     """
     获取文件
     https://12.onebot.dev/interface/file/actions/#get_file
     """
-    data = GetFile(**kwargs)
     file_id = data.file_id
     type_ = data.type
     file = database.get_file(UUID(file_id))
@@ -323,7 +455,7 @@ async def get_file(echo: str, **kwargs):
         )
 
 
-async def qq_ban_group_member(client: Client, echo: str, **kwargs):
+async def qq_ban_group_member(client: Client, echo: str, data: BanGroupMember):
     """
     扩展动作：禁言群成员
 
@@ -331,7 +463,6 @@ async def qq_ban_group_member(client: Client, echo: str, **kwargs):
     user_id：被禁言群成员的 QQ 号
     duration：禁言时间，单位为秒（默认为 600）
     """
-    data = BanGroupMember(**kwargs)
     duration = data.duration
     if not duration:
         duration = 600
@@ -340,42 +471,40 @@ async def qq_ban_group_member(client: Client, echo: str, **kwargs):
 
 
 async def _set_admin(
-    client: Client, echo: str, is_admin: bool, **kwargs
+    client: Client, echo: str, is_admin: bool, data: GroupMember
 ) -> SuccessRequest:
     """
     群管理员操作
     """
-    data = GroupMember(**kwargs)
     await cai_set_admin(client, data.group_id, data.user_id, is_admin)
     return OKInfo(data=None, echo=echo)
 
 
-async def qq_set_group_admin(client: Client, echo: str, **kwargs):
+async def qq_set_group_admin(client: Client, echo: str, data: GroupMember):
     """
     扩展动作：设置群管理员
 
     group_id：群号
     user_id：群成员的 QQ 号
     """
-    return await _set_admin(client, echo, True, **kwargs)
+    return await _set_admin(client, echo, True, data)
 
 
-async def qq_unset_group_admin(client: Client, echo: str, **kwargs):
+async def qq_unset_group_admin(client: Client, echo: str, data: GroupMember):
     """
     扩展动作：取消设置群管理员
 
     group_id：群号
     user_id：群成员的 QQ 号
     """
-    return await _set_admin(client, echo, False, **kwargs)
+    return await _set_admin(client, echo, False, data)
 
 
-async def upload_file(echo: str, **kwargs):
+async def upload_file(echo: str, parsed_data: File):
     """
     上传文件
     https://12.onebot.dev/interface/file/actions/#upload_file
     """
-    parsed_data = File(**kwargs)
     type_ = parsed_data.type
     name = parsed_data.name
     if type_ == "url":
@@ -427,3 +556,175 @@ async def get_version(echo: str, **kwargs):
         ),
         echo=echo,
     )
+
+
+async def qq_get_metrics(echo: str, **kwargs):
+    """
+    扩展动作：获取运行指标
+
+    返回 counters（计数器）和 gauges（仪表盘），
+    每项指标为 {"labels": 标签, "value": 值} 的列表
+    """
+    return OKInfo(data=metrics.snapshot(), echo=echo)
+
+
+def _get_concurrency(
+    concurrency: Optional[int], limit: Optional[int] = None
+) -> int:
+    """
+    批量动作同时执行的最大数
+
+    concurrency 请求的最大数，不超过 limit
+    limit 上限，默认为配置的 batch_concurrency
+    """
+    limit = limit or BATCH_CONCURRENCY
+    return max(1, min(concurrency, limit)) if concurrency else limit
+
+
+async def _run_bulk(
+    items: Sequence[T],
+    run: Callable[[T], Awaitable[SuccessRequest]],
+    concurrency: Optional[int],
+    limit: Optional[int] = None,
+) -> OKInfo:
+    """
+    并发执行批量动作的各项
+
+    按顺序返回各项的响应，单项出错时该项返回 20002，不影响其他项
+    limit 同时执行的上限，默认为配置的 batch_concurrency
+    """
+    semaphore = asyncio.Semaphore(_get_concurrency(concurrency, limit))
+
+    async def run_item(item: T) -> SuccessRequest:
+        async with semaphore:
+            try:
+                return await run(item)
+            except Exception as e:
+                logger.warning(f"批量动作的一项执行失败：{str(e)}")
+                return FailedInfo(
+                    retcode=20002,
+                    message=STATUS[20002],
+                    data={"info": str(e)},
+                )
+
+    responses = await asyncio.gather(*[run_item(i) for i in items])
+    return OKInfo(data=list(responses), echo=None)
+
+
+async def qq_delete_messages(client: Client, echo: str, data: MessageIDs):
+    """
+    扩展动作：批量撤回消息
+
+    message_ids：消息 ID 列表
+    concurrency：同时撤回的最大消息数，不超过配置的上限
+
+    按顺序返回各消息的撤回结果，格式与 delete_message 的响应相同
+    """
+    resp = await _run_bulk(
+        data.message_ids,
+        lambda message_id: delete_message(
+            client, None, MessageID(message_id=message_id)  # type: ignore
+        ),
+        data.concurrency,
+    )
+    resp.echo = echo
+    return resp
+
+
+async def qq_ban_group_members(
+    client: Client, echo: str, data: BanGroupMembers
+):
+    """
+    扩展动作：批量禁言群成员
+
+    group_id：群号
+    user_ids：被禁言群成员的 QQ 号列表
+    duration：禁言时间，单位为秒（默认为 600）
+    concurrency：同时执行的最大数，不超过配置的上限
+
+    按顺序返回各群成员的禁言结果
+    """
+    duration = data.duration or 600
+
+    async def ban(user_id: int) -> SuccessRequest:
+        await mute_member(client, data.group_id, user_id, duration)
+        return OKInfo(data=None, echo=None)
+
+    resp = await _run_bulk(data.user_ids, ban, data.concurrency)
+    resp.echo = echo
+    return resp
+
+
+async def _set_admins(
+    client: Client, echo: str, is_admin: bool, data: GroupMembers
+) -> SuccessRequest:
+    """
+    批量群管理员操作
+    """
+
+    async def set_admin(user_id: int) -> SuccessRequest:
+        await cai_set_admin(client, data.group_id, user_id, is_admin)
+        return OKInfo(data=None, echo=None)
+
+    resp = await _run_bulk(data.user_ids, set_admin, data.concurrency)
+    resp.echo = echo
+    return resp
+
+
+async def qq_set_group_admins(client: Client, echo: str, data: GroupMembers):
+    """
+    扩展动作：批量设置群管理员
+
+    group_id：群号
+    user_ids：群成员的 QQ 号列表
+    concurrency：同时执行的最大数，不超过配置的上限
+
+    按顺序返回各群成员的设置结果
+    """
+    return await _set_admins(client, echo, True, data)
+
+
+async def qq_unset_group_admins(client: Client, echo: str, data: GroupMembers):
+    """
+    扩展动作：批量取消设置群管理员
+
+    group_id：群号
+    user_ids：群成员的 QQ 号列表
+    concurrency：同时执行的最大数，不超过配置的上限
+
+    按顺序返回各群成员的取消结果
+    """
+    return await _set_admins(client, echo, False, data)
+
+
+async def qq_batch(echo: str, data: Batch):
+    """
+    扩展动作：批量执行动作
+
+    requests：动作请求列表，每项格式与单个动作请求相同
+    sequential：是否按顺序逐个执行（默认为并发执行）
+    concurrency：并发执行时同时执行的最大动作数，不超过配置的上限
+
+    按请求顺序返回各动作的响应，单个动作失败不影响其他动作
+    """
+    limit = 1 if data.sequential else _get_concurrency(data.concurrency)
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(request: dict) -> SuccessRequest:
+        action = request.get("action")
+        if isinstance(action, str) and resolve_action(action)[0] == "qq.batch":
+            return FailedInfo(
+                retcode=10003,
+                echo=request.get("echo"),
+                message=STATUS[10003],
+                data={"reason": "qq.batch cannot be nested"},
+            )
+        async with semaphore:
+            return await run_action_by_dict(request)
+
+    responses = await asyncio.gather(*[run(i) for i in data.requests])
+    return OKInfo(data=list(responses), echo=echo)
+
+
+ACTIONS = collect_actions(globals())
+"""动作注册表，键为 OneBot 动作名"""
@@ -1,16 +1,33 @@
 """OneBot CAI 配置"""
-from enum import IntEnum
 from pathlib import Path
-from typing import Optional
+from enum import Enum, IntEnum
+from typing import Dict, List, Literal, Optional
 
 from tomlkit import load
-from pydantic import AnyUrl, HttpUrl, BaseModel
 from cai.client.status_service import OnlineStatus
+from pydantic import AnyUrl, HttpUrl, BaseModel, validator
 
 from ..const import Protocol
 from .generator import create_config
 
 
+def _to_list(value):
+    """将单个连接配置转换为列表，使单个与多个配置写法均可用"""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _unique_shard_keys(value):
+    """检查推送地址的分片标识（默认为地址）不重复，否则重复的地址将收不到事件"""
+    keys = set()
+    for item in value:
+        if (key := item.shard_key or str(item.url)) in keys:
+            raise ValueError(f"推送地址的分片标识重复：{key}")
+        keys.add(key)
+    return value
+
+
 class WebSocketUrl(AnyUrl):
     """WebSocket Url 模型"""
 
@@ -24,9 +41,47 @@ class WebSocketUrl(AnyUrl):
 class ConnectWay(IntEnum):
     """连接方式枚举类"""
 
+    MULTIPLE = 0
+    """同时启用所有已配置的连接方式"""
     HTTP = 1
     WS = 2
     WS_REVERSE = 3
+    UNIX = 4
+
+
+class OverflowPolicy(str, Enum):
+    """事件队列溢出策略枚举类"""
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    SPILL = "spill"
+    """暂存至临时文件"""
+
+
+class Runtime(str, Enum):
+    """运行时枚举类"""
+
+    AUTO = "auto"
+    """已安装时使用 uvloop 事件循环与 httptools HTTP 解析器"""
+    ASYNCIO = "asyncio"
+    """使用标准库 asyncio 事件循环与 h11 HTTP 解析器"""
+
+
+class HTTPServer(str, Enum):
+    """HTTP 服务器实现枚举类"""
+
+    UVICORN = "uvicorn"
+    HYPERCORN = "hypercorn"
+    """支持 HTTP/2，需安装 http2 额外依赖"""
+
+
+class EventRoute(str, Enum):
+    """事件路由方式枚举类"""
+
+    BROADCAST = "broadcast"
+    """向所有推送地址推送"""
+    SHARD = "shard"
+    """按会话（群聊为群号，私聊为 QQ 号）分片，每个会话只推送到其中一个地址"""
 
 
 class HeartBeatConfig(BaseModel):
@@ -41,6 +96,37 @@ class HeartBeatConfig(BaseModel):
     """心跳间隔（毫秒）"""
 
 
+class ActionConfig(BaseModel):
+    """动作设置"""
+
+    timeout: Optional[int] = None  # default: 60000
+    """动作执行超时时间（毫秒），0 表示不超时"""
+    timeouts: Dict[str, int] = {}
+    """各动作的超时时间（毫秒），键为动作名，覆盖 timeout"""
+    breaker_threshold: Optional[int] = None  # default: 5
+    """打开熔断器的连续失败次数，0 表示只在机器人下线时打开"""
+    breaker_reset_interval: Optional[int] = None  # default: 30000
+    """熔断器打开后进入半开状态的时间（毫秒）"""
+    max_concurrency: Optional[int] = None  # default: 64
+    """全局同时执行的最大动作数，0 表示不限"""
+    client_concurrency: Optional[int] = None  # default: 16
+    """每个客户端（连接）同时执行的最大动作数，0 表示不限"""
+    client_queue_size: Optional[int] = None  # default: 100
+    """每个客户端超出限制时可等待的最大请求数，队列已满时返回 32001"""
+    cache_size: Optional[int] = None  # default: 1024
+    """只读动作响应缓存的最大条目数，0 表示不缓存"""
+    cache_ttls: Dict[str, int] = {}
+    """各只读动作的响应缓存时间（毫秒），键为动作名，0 表示不缓存该动作"""
+    idempotency_ttl: Optional[int] = None  # default: 600000
+    """幂等键的有效期（毫秒）"""
+    idempotency_size: Optional[int] = None  # default: 10000
+    """最多保存的幂等键数"""
+    multi_send_concurrency: Optional[int] = None  # default: 4
+    """qq.send_message_multi 同时发送的最大数"""
+    multi_send_rate: Optional[float] = None  # default: 5
+    """qq.send_message_multi 每秒最多发送的消息数，所有请求共用，0 表示不限"""
+
+
 class HTTPWebhookConfig(BaseModel):
     """
     OneBot 12 HTTP Webhook 配置
@@ -51,6 +137,18 @@ class HTTPWebhookConfig(BaseModel):
     """Webhook 上报地址"""
     timeout: Optional[int] = None  # default: 5
     """上报请求超时时间（毫秒）"""
+    max_retries: Optional[int] = None  # default: 3
+    """上报失败时的最大重试次数"""
+    retry_interval: Optional[int] = None  # default: 1000
+    """上报失败时的重试间隔（毫秒），每次重试翻倍"""
+    max_concurrent_posts: Optional[int] = None  # default: 4
+    """同时进行的最大上报请求数"""
+    queue_size: Optional[int] = None  # default: 10000
+    """待上报事件队列大小（事件数），0 表示不限大小"""
+    queue_overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+    """待上报事件队列已满时的处理策略"""
+    shard_key: Optional[str] = None  # default: url
+    """分片标识，用于按会话分片推送"""
 
 
 class HTTPConfig(BaseModel):
@@ -63,12 +161,25 @@ class HTTPConfig(BaseModel):
     """HTTP 服务器监听 IP"""
     port: int
     """HTTP 服务器监听端口"""
+    server: HTTPServer = HTTPServer.UVICORN
+    """HTTP 服务器实现，hypercorn 支持 HTTP/2（明文 h2c 与 TLS）"""
+    ssl_certfile: Optional[str] = None
+    """TLS 证书文件路径，与 ssl_keyfile 同时配置时启用 HTTPS"""
+    ssl_keyfile: Optional[str] = None
+    """TLS 私钥文件路径"""
     event_enabled: Optional[bool] = False
     """是否启用 get_latest_events 元动作"""
     event_buffer_size: Optional[int] = 0
     """事件缓冲区大小，0 表示不限大小"""
-    webhook: Optional[HTTPWebhookConfig] = None
-    """HTTP Webhook 配置"""
+    webhook: List[HTTPWebhookConfig] = []
+    """HTTP Webhook 配置，可配置多个推送地址"""
+
+    _webhook_to_list = validator("webhook", pre=True, allow_reuse=True)(
+        _to_list
+    )
+    _webhook_shard_keys = validator("webhook", allow_reuse=True)(
+        _unique_shard_keys
+    )
 
 
 class WebSocketConfig(BaseModel):
@@ -81,6 +192,8 @@ class WebSocketConfig(BaseModel):
     """WebSocket 服务器监听 IP"""
     port: int
     """WebSocket 服务器监听端口"""
+    max_concurrent_actions: Optional[int] = None  # default: 16
+    """每个连接同时执行的最大动作数"""
 
 
 class ReverseWebSocketConfig(BaseModel):
@@ -93,6 +206,35 @@ class ReverseWebSocketConfig(BaseModel):
     """反向 WebSocket 连接地址"""
     reconnect_interval: Optional[int] = None  # default: 3000
     """反向 WebSocket 重连间隔（毫秒）"""
+    reconnect_max_interval: Optional[int] = None  # default: 60000
+    """反向 WebSocket 最大重连间隔（毫秒），重连间隔按指数退避增长至该值"""
+    replay_buffer_size: Optional[int] = None  # default: 1000
+    """断线重放窗口大小（事件数），0 表示不重放"""
+    queue_size: Optional[int] = None  # default: 10000
+    """待发送事件队列大小（事件数），0 表示不限大小"""
+    queue_overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+    """待发送事件队列已满时的处理策略"""
+    shard_key: Optional[str] = None  # default: url
+    """分片标识，用于按会话分片推送"""
+    max_concurrent_actions: Optional[int] = None  # default: 16
+    """同时执行的最大动作数"""
+
+
+class UnixSocketConfig(BaseModel):
+    """
+    Unix 套接字配置
+
+    每帧由 4 字节大端序长度头和 JSON 或 MessagePack 数据组成
+    """
+
+    path: str
+    """套接字文件路径"""
+    encoding: Literal["json", "msgpack"] = "msgpack"
+    """事件编码，动作响应使用与请求相同的编码"""
+    permissions: int = 0o600
+    """套接字文件权限"""
+    max_concurrent_actions: Optional[int] = None  # default: 16
+    """每个连接同时执行的最大动作数"""
 
 
 class AccountConfig(BaseModel):
@@ -119,6 +261,16 @@ class UniversalConfig(BaseModel):
     """心跳元事件时区"""
     access_token: Optional[str]
     """OneBot 12 访问令牌"""
+    event_route: EventRoute = EventRoute.BROADCAST
+    """配置多个 HTTP Webhook 或反向 WebSocket 地址时的事件路由方式"""
+    runtime: Runtime = Runtime.AUTO
+    """运行时"""
+    batch_concurrency: Optional[int] = None  # default: 8
+    """qq.batch 等批量动作同时执行的最大动作数"""
+    media_ttl: Optional[int] = None  # default: 86400000
+    """qq.prepare_media 返回的媒体句柄有效期（毫秒）"""
+    media_store_size: Optional[int] = None  # default: 1024
+    """最多保存的媒体句柄数"""
 
 
 class Config(BaseModel):
@@ -130,13 +282,24 @@ class Config(BaseModel):
     """账户设置"""
     heartbeat: Optional[HeartBeatConfig] = None  # default: HeartBeatConfig()
     """心跳元事件"""
+    action: ActionConfig = ActionConfig()
+    """动作设置"""
 
     http: Optional[HTTPConfig] = None
     """HTTP 和 HTTP Webhook 连接配置"""
     ws: Optional[WebSocketConfig] = None
     """正向 WebSocket 连接配置"""
-    ws_reverse: Optional[ReverseWebSocketConfig] = None
-    """反向 WebSocket 连接配置"""
+    ws_reverse: List[ReverseWebSocketConfig] = []
+    """反向 WebSocket 连接配置，可配置多个连接地址"""
+
+    _ws_reverse_to_list = validator("ws_reverse", pre=True, allow_reuse=True)(
+        _to_list
+    )
+    _ws_reverse_shard_keys = validator("ws_reverse", allow_reuse=True)(
+        _unique_shard_keys
+    )
+    unix: Optional[UnixSocketConfig] = None
+    """Unix 套接字连接配置"""
 
 
 def load_config() -> Config:
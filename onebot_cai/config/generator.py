@@ -6,7 +6,8 @@ UNIVERSAL_CONFIG = """# OneBot CAI 配置
 
 # 通用设置
 [universal]
-# 连接方式：1为 HTTP，2为正向 WebSocket，3为反向 WebSocket
+# 连接方式：1为 HTTP，2为正向 WebSocket，3为反向 WebSocket，4为 Unix 套接字
+# 0为同时启用下方所有已配置的连接方式，各连接方式共用同一事件序号
 connect_way = {way}
 # 日志等级（填写数值）
 # 数值参见 https://docs.python.org/zh-cn/3/library/logging.html#logging-levels
@@ -15,6 +16,18 @@ log_level = 20
 access_token = "{access_token}"
 # 定时任务时区
 timezone = "Asia/Shanghai"
+# 配置多个 HTTP Webhook 或反向 WebSocket 地址时的事件路由方式
+# broadcast 为推送到所有地址，shard 为按会话（群号或 QQ 号）分片推送到其中一个地址
+event_route = "broadcast"
+# 运行时：auto 为已安装时使用 uvloop 事件循环与 httptools HTTP 解析器
+# （可通过 onebot-cai[speedups] 安装），asyncio 为使用标准库事件循环与 h11
+runtime = "auto"
+# qq.batch、qq.delete_messages 等批量动作同时执行的最大动作数
+batch_concurrency = 8
+# qq.prepare_media 返回的媒体句柄有效期（毫秒），应短于 QQ 服务器保留已上传媒体的时间
+media_ttl = 86400000
+# 最多保存的媒体句柄数，超出时淘汰最久未使用的句柄
+media_store_size = 1024
 
 # 账号设置
 [account]
@@ -34,7 +47,52 @@ protocol = 5
 # 是否启用心跳
 enabled = {heartbeat_enabled}
 # 心跳间隔（毫秒）
-interval = {heartbeat_interval}"""
+interval = {heartbeat_interval}
+
+# 动作设置
+[action]
+# 动作执行超时时间（毫秒），超时将取消执行并返回 32000，0 表示不超时
+# 应用端可通过动作参数 qq.timeout（毫秒）缩短单次请求的超时时间
+timeout = 60000
+# 熔断器：连续失败达到该次数或机器人下线时，需要 QQ 会话的动作将直接失败，
+# 0 表示只在机器人下线时打开
+breaker_threshold = 5
+# 熔断器打开后进入半开状态（放行一个探测动作）的时间（毫秒）
+breaker_reset_interval = 30000
+# 全局同时执行的最大动作数，0 表示不限
+max_concurrency = 64
+# 每个客户端同时执行的最大动作数，0 表示不限
+# 客户端为一个 WebSocket 或 Unix 套接字连接，HTTP 按应用端 IP 及 X-Client-ID 请求头区分；
+# 并发执行的 qq.batch 按同时执行的子动作数计
+client_concurrency = 16
+# 超出限制的请求按客户端排队，各客户端轮流执行；
+# 每个客户端可等待的最大请求数，队列已满时返回 32001
+client_queue_size = 100
+# 只读动作（获取群、群成员、好友信息等）响应缓存的最大条目数，0 表示不缓存
+# 群成员变动时自动失效，应用端可通过动作参数 no_cache = true 跳过缓存
+cache_size = 1024
+# send_message 与 qq.send_message_multi 可传入动作参数 qq.idempotency_key（其他动作传入时返回 10003），
+# 有效期内重试相同幂等键的请求将等待或直接返回原请求的结果，而不会重复发送
+# 幂等键的有效期（毫秒）
+idempotency_ttl = 600000
+# 最多保存的幂等键数
+idempotency_size = 10000
+# qq.send_message_multi 向多个目标发送同一消息时同时发送的最大数
+multi_send_concurrency = 4
+# qq.send_message_multi 每秒最多发送的消息数，所有请求共用，0 表示不限
+# 该动作默认不超时，可在 [action.timeouts] 中配置
+multi_send_rate = 5
+
+# 各动作的超时时间（毫秒），覆盖 timeout
+[action.timeouts]
+# "send_message" = 120000
+# "get_group_member_list" = 10000
+
+# 各只读动作的响应缓存时间（毫秒），0 表示不缓存该动作
+# 默认 get_version 为 3600000，其他为 60000
+[action.cache_ttls]
+# "get_group_member_info" = 300000
+# "get_self_info" = 0"""
 HTTP_CONFIG = """\n
 # HTTP 连接设置
 [http]
@@ -42,17 +100,36 @@ HTTP_CONFIG = """\n
 host = "{http_host}"
 # 监听端口
 port = {http_port}
+# HTTP 服务器实现：uvicorn 仅支持 HTTP/1.1，
+# hypercorn 另支持 HTTP/2（需安装 onebot-cai[http2]），可在一个连接上并发多个动作请求，
+# 适合只能使用单个连接的应用端；应用端可建立多个连接时 uvicorn 的吞吐量更高
+server = "uvicorn"
+# TLS 证书与私钥文件路径，均配置时启用 HTTPS，hypercorn 将通过 ALPN 协商 HTTP/2
+# ssl_certfile = ""
+# ssl_keyfile = ""
 # 是否启用 get_latest_events 元动作
 event_enabled = {use_get_latest_events}
 # 事件缓冲区大小，超过该大小将会丢弃最旧的事件，0 表示不限大小
 event_buffer_size = {event_buffer_size}"""
 WEBHOOK_CONFIG = """\n
 # HTTP Webhook 连接设置
+# 如需推送到多个地址，可将 [http.webhook] 改为多个 [[http.webhook]]
 [http.webhook]
 # Webhook 推送地址
 url = "{webhook_url}"
 # 推送请求超时时间（毫秒），0 表示不超时
-timeout = {timeout}"""
+timeout = {timeout}
+# 推送失败时的最大重试次数
+max_retries = 3
+# 推送失败时的重试间隔（毫秒），每次重试翻倍
+retry_interval = 1000
+# 同时进行的最大推送请求数，大于 1 时事件可能不按顺序到达
+max_concurrent_posts = 4
+# 待推送事件队列大小（事件数），0 表示不限大小
+queue_size = 10000
+# 待推送事件队列已满时的处理策略：drop_oldest 为丢弃最旧的事件，
+# drop_newest 为丢弃新事件，spill 为暂存至临时文件
+queue_overflow = "drop_oldest\""""
 WEBSOCKET_CONFIG = """\n
 # 正向 WebSocket 连接设置
 [ws]
@@ -62,11 +139,31 @@ host = "{ws_url}"
 port = {ws_port}"""
 REVERSE_CONFIG = """\n
 # 反向 WebSocket 连接设置
+# 如需连接多个服务器，可将 [ws_reverse] 改为多个 [[ws_reverse]]
 [ws_reverse]
 # 反向 WebSocket 连接地址
 url = "{url}"
 # 反向 WebSocket 重连间隔，(毫秒)，必须大于 0
-reconnect_interval = {reconnect_interval}"""
+reconnect_interval = {reconnect_interval}
+# 反向 WebSocket 最大重连间隔（毫秒），重连间隔按指数退避增长至该值
+reconnect_max_interval = 60000
+# 断线重放窗口大小（事件数），0 表示不重放
+replay_buffer_size = 1000
+# 待发送事件队列大小（事件数），0 表示不限大小
+queue_size = 10000
+# 待发送事件队列已满时的处理策略：drop_oldest 为丢弃最旧的事件，
+# drop_newest 为丢弃新事件，spill 为暂存至临时文件
+queue_overflow = "drop_oldest\""""
+
+UNIX_CONFIG = """\n
+# Unix 套接字连接设置
+[unix]
+# 套接字文件路径
+path = "{path}"
+# 事件编码：json 或 msgpack，动作响应使用与请求相同的编码
+encoding = "msgpack"
+# 套接字文件权限
+permissions = 0o600"""
 
 
 def _int_while(
@@ -155,8 +252,10 @@ def create_config():
     password = _not_null("密码")
     access_token = _optional("鉴权密钥", lambda _: _)
     while True:
-        connect_way = _not_null("连接方式（1为HTTP，2为正向WebSocket，" "3为反向WebSocket）")
-        if connect_way not in ["1", "2", "3"]:
+        connect_way = _not_null(
+            "连接方式（1为HTTP，2为正向WebSocket，" "3为反向WebSocket，4为Unix套接字）"
+        )
+        if connect_way not in ["1", "2", "3", "4"]:
             print("输入无效！请重新输入")
         else:
             heartbeat = _to_bool("是否启用心跳", True)
@@ -192,6 +291,9 @@ def create_config():
                         url=reverse_url, reconnect_interval=reconnect_interval
                     )
                 )
+            elif connect_way == "4":
+                path = _not_null("Unix 套接字文件路径")
+                config_list.append(UNIX_CONFIG.format(path=path))
             break
 
     config_str = "".join(config_list)
@@ -5,8 +5,10 @@ __all__ = [
     "http",
     "ws",
     "ws_reverse",
+    "unix",
     "exception",
     "models",
+    "router",
 ]
 from .models import RequestModel
 from .exception import HTTPClientError
@@ -0,0 +1,214 @@
+"""
+OneBot CAI 事件总线模块
+
+CAI 事件只转换、保存和编码一次，然后分发给所有已启用的连接方式
+"""
+import asyncio
+from time import time
+from json import dumps
+from uuid import uuid4
+from typing import Dict, Union, Callable, Optional, Awaitable
+
+from msgpack import packb
+from cai.api.client import Client
+from cai.client.events.base import Event
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from ..log import logger
+from ..config import config
+from ..run import get_client
+from ..const import EVENT_SEQ_FIELD
+from ..run import close as run_close
+from ..utils.database import database
+from ..models.message import DatabaseMessage
+from ..msg.event import cai_event_to_dataclass
+from ..models.event import (
+    BaseEvent,
+    HeartbeatEvent,
+    BaseMessageEvent,
+    GroupMessageEvent,
+    PrivateMessageEvent,
+    dataclass_to_dict,
+)
+
+
+class EncodedEvent:
+    """已转换的事件，各编码结果在首次使用时缓存，供所有连接方式共用"""
+
+    __slots__ = ("seq", "data", "_text", "_binary", "_msgpack")
+
+    def __init__(self, event: Union[BaseEvent, dict], seq: int):
+        """
+        event 事件
+        seq 事件序号
+        """
+        self.seq = seq
+        self.data: dict = (
+            dataclass_to_dict(event) if isinstance(event, BaseEvent) else event
+        )
+        self.data[EVENT_SEQ_FIELD] = seq
+        self._text: Optional[str] = None
+        self._binary: Optional[bytes] = None
+        self._msgpack: Optional[bytes] = None
+
+    @property
+    def is_meta(self) -> bool:
+        """是否为元事件"""
+        return self.data.get("type") == "meta"
+
+    @property
+    def text(self) -> str:
+        """JSON 字符串"""
+        if self._text is None:
+            self._text = dumps(self.data)
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        """JSON 二进制数据"""
+        if self._binary is None:
+            self._binary = self.text.encode()
+        return self._binary
+
+    @property
+    def msgpack(self) -> bytes:
+        """MessagePack 二进制数据"""
+        if self._msgpack is None:
+            self._msgpack = packb(self.data)
+        return self._msgpack
+
+
+PushEvent = Callable[[EncodedEvent], Awaitable[None]]
+
+
+def save_message(event: BaseMessageEvent) -> Optional[str]:
+    save_msg = None
+    if isinstance(event, GroupMessageEvent):
+        save_msg = DatabaseMessage(
+            msg=event.message,
+            time=int(event.time),
+            seq=event.__seq__,
+            group=event.group_id,
+            rand=event.__rand__,
+        )
+    elif isinstance(event, PrivateMessageEvent):
+        save_msg = DatabaseMessage(
+            msg=event.message,
+            time=int(event.time),
+            seq=event.__seq__,
+            user=event.user_id,
+        )
+    if save_msg:
+        return database.save_message(save_msg)
+
+
+class EventBus:
+    """事件总线"""
+
+    def __init__(self):
+        self.subscribers: Dict[PushEvent, bool] = {}
+        """订阅者及其是否接收心跳"""
+        self.scheduler: Optional[AsyncIOScheduler] = None
+        self.seq = 0
+        """最后分配的事件序号"""
+        self._listening = False
+
+    def start(self):
+        """注册 CAI 事件监听并启动心跳"""
+        client = get_client()
+        if client and not self._listening:
+            logger.debug("注册事件监听")
+            client.add_event_listener(self.handle)
+            self._listening = True
+
+        if (heartbeat_config := config.heartbeat) and heartbeat_config.enabled:
+            self.scheduler = AsyncIOScheduler()
+            interval = heartbeat_config.interval
+            if not interval:
+                interval = 3000
+            self.scheduler.add_job(
+                self.heartbeat,
+                "cron",
+                name="heartbeat",
+                second=f"*/{int(interval / 1000)}",
+                args=[config.account.uin, interval],
+                timezone=config.universal.timezone,
+            )
+            self.scheduler.start()
+
+    async def stop(self):
+        """关闭心跳"""
+        await run_close(self.scheduler)
+        self.scheduler = None
+
+    def subscribe(self, push_event: PushEvent, heartbeat: bool = True):
+        """
+        订阅事件
+
+        push_event 推送事件的函数
+        heartbeat 是否接收心跳事件
+        """
+        if not self.subscribers:
+            self.start()
+        logger.debug(f"订阅事件：{push_event}")
+        self.subscribers[push_event] = heartbeat
+
+    async def unsubscribe(self, push_event: PushEvent):
+        """取消订阅事件，所有订阅者取消后关闭心跳"""
+        if self.subscribers.pop(push_event, None) is not None:
+            if not self.subscribers:
+                await self.stop()
+
+    async def publish(self, data: Union[BaseEvent, dict]):
+        """为事件分配序号并分发给所有订阅者"""
+        self.seq += 1
+        event = EncodedEvent(data, self.seq)
+        is_heartbeat = isinstance(data, HeartbeatEvent)
+        subscribers = [
+            push_event
+            for push_event, heartbeat in self.subscribers.items()
+            if heartbeat or not is_heartbeat
+        ]
+        for result in await asyncio.gather(
+            *[push_event(event) for push_event in subscribers],
+            return_exceptions=True,
+        ):
+            if isinstance(result, Exception):
+                logger.opt(exception=result).warning("推送事件时出现异常")
+
+    async def handle(self, client: Client, event: Event):
+        """CAI 事件监听"""
+        if data := await cai_event_to_dataclass(client.session.uin, event):
+            if isinstance(data, BaseMessageEvent):
+                if id_ := save_message(data):
+                    setattr(data, "message_id", id_)
+            await self.publish(data)
+
+    async def heartbeat(self, bot_id: int, interval: int):
+        """心跳服务"""
+        await self.publish(
+            HeartbeatEvent(
+                id=str(uuid4()),
+                time=time(),
+                self_id=bot_id,
+                interval=interval,
+            )
+        )
+
+
+event_bus = EventBus()
+
+
+async def init(push_event: PushEvent, heartbeat: bool = True):
+    """
+    订阅事件总线，首个订阅者将注册 CAI 事件监听并启动心跳
+
+    push_event 推送事件的函数
+    heartbeat 是否接收心跳事件
+    """
+    event_bus.subscribe(push_event, heartbeat)
+
+
+async def close(push_event: PushEvent):
+    """取消订阅事件总线"""
+    await event_bus.unsubscribe(push_event)
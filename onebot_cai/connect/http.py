@@ -1,41 +1,163 @@
 """OneBot CAI HTTP 与 HTTP Webhook 模块"""
-from typing import Union, Callable, Optional
+import asyncio
+from typing import Set, Union, Callable, Optional
 
 from msgpack import unpackb
-from cai.api.client import Client
-from cai.client.events import Event
+from pydantic import HttpUrl
 from fastapi.routing import APIRoute
 from fastapi.responses import Response
 from starlette.exceptions import HTTPException
 from fastapi import Header, Depends, FastAPI, Request
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from httpx import AsyncClient, ConnectError, HTTPStatusError
+from httpx import HTTPError, AsyncClient, HTTPStatusError
 
 from ..log import logger
 from ..config import config
+from ..run import run_action
 from ..const import make_header
+from .router import EventRouter
 from .models import RequestModel
-from ..run import close, run_action
-from ..msg.event import cai_event_to_dataclass
-from ..models.event import BaseEvent, BaseMessageEvent, dataclass_to_dict
+from ..utils.metrics import metrics
+from ..config.config import OverflowPolicy
+from .bus import EncodedEvent, init, close
 from .utils import (
-    MsgpackResponse,
-    init,
-    save_message,
+    EventQueue,
+    run_admitted,
+    encode_response,
+    get_action_weight,
     check_authorization,
     register_exception_handles,
 )
 
-HTTP = config.http
-WEBHOOK = HTTP.webhook if HTTP else None
-if WEBHOOK:
-    ADDRESS = WEBHOOK.url
-    TIMEOUT = WEBHOOK.timeout / 1000 if WEBHOOK.timeout else 5
-else:
-    ADDRESS = TIMEOUT = None
-del HTTP, WEBHOOK
 SECRET = config.universal.access_token
-scheduler: Optional[AsyncIOScheduler]
+
+
+class WebhookClient:
+    """
+    HTTP Webhook 客户端，每个推送地址拥有独立的队列、重试状态和指标
+
+    同时进行的推送请求数有上限，推送地址不可用时事件留在有界队列中按溢出策略处理
+    """
+
+    def __init__(
+        self,
+        address: HttpUrl,
+        timeout: float,
+        max_retries: int,
+        retry_interval: int,
+        max_concurrent_posts: int,
+        queue_size: int,
+        queue_overflow: Union[OverflowPolicy, str],
+    ):
+        self.address = address
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.queue = EventQueue(
+            queue_size, queue_overflow, str(address), "webhook"
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrent_posts)
+        self.task: Optional[asyncio.Task] = None
+        self.posts: Set[asyncio.Task] = set()
+        self.http_client: Optional[AsyncClient] = None
+
+    def start(self, bot_id: int):
+        """启动推送任务"""
+        headers = make_header(bot_id, True, config.universal.access_token)
+        self.http_client = AsyncClient(headers=headers)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """停止推送任务"""
+        tasks = [self.task, *self.posts] if self.task else list(self.posts)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.queue.close()
+        if self.http_client:
+            await self.http_client.aclose()
+
+    def put(self, seq: int, body: str):
+        """将已编码的事件加入队列"""
+        self.queue.put(seq, body)
+
+    async def post(self, body: str) -> bool:
+        """推送事件，失败时按退避间隔重试，返回是否推送成功"""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                metrics.inc("webhook_retries", endpoint=self.address)
+                await asyncio.sleep(
+                    self.retry_interval * 2 ** (attempt - 1) / 1000
+                )
+            try:
+                resp = await self.http_client.post(  # type: ignore
+                    self.address, content=body, timeout=self.timeout
+                )
+                resp.raise_for_status()
+                return True
+            except HTTPStatusError as e:
+                status_code = e.response.status_code
+                logger.warning(
+                    f"向 HTTP Webhook 服务器 {self.address} 推送事件失败："
+                    f"意外的状态码 {status_code}"
+                )
+                if status_code < 500:  # 客户端错误重试无意义
+                    break
+            except HTTPError as e:  # 连接、超时、读写和协议错误等
+                logger.warning(
+                    f"向 HTTP Webhook 服务器 {self.address} 推送事件失败：{str(e)}"
+                )
+        return False
+
+    async def deliver(self, body: str):
+        """推送单个事件并记录结果"""
+        try:
+            sent = await self.post(body)
+        except Exception:
+            # 单个事件出错不能影响其他事件的推送
+            logger.exception(f"向 HTTP Webhook 服务器 {self.address} 推送事件时出现未知错误")
+            sent = False
+        finally:
+            self.semaphore.release()
+        if sent:
+            metrics.inc("webhook_events_sent", endpoint=self.address)
+        else:
+            metrics.inc("webhook_events_failed", endpoint=self.address)
+
+    async def run(self):
+        """推送循环，同时进行的推送达到上限时事件留在队列中"""
+        while True:
+            await self.semaphore.acquire()
+            try:
+                _, body = await self.queue.get()
+            except BaseException:
+                self.semaphore.release()
+                raise
+            task = asyncio.create_task(self.deliver(body))
+            self.posts.add(task)
+            task.add_done_callback(self.posts.discard)
+
+
+webhook_clients = [
+    WebhookClient(
+        webhook.url,
+        webhook.timeout / 1000 if webhook.timeout else 5,
+        3 if webhook.max_retries is None else webhook.max_retries,
+        webhook.retry_interval or 1000,
+        webhook.max_concurrent_posts or 4,
+        10000 if webhook.queue_size is None else webhook.queue_size,
+        webhook.queue_overflow,
+    )
+    for webhook in (config.http.webhook if config.http else [])
+]
+webhook_router = EventRouter(
+    config.universal.event_route,
+    [
+        (webhook.shard_key or str(webhook.url), webhook_client)
+        for webhook, webhook_client in zip(
+            config.http.webhook if config.http else [], webhook_clients
+        )
+    ],
+)
 
 
 # Custom Encoding
@@ -71,52 +193,27 @@ app.router.route_class = MsgpackRoute
 register_exception_handles(app)
 
 
-async def request(
-    data: Union[BaseEvent, dict],
-    bot_id: int,
-):
-    """向 HTTP Webhook 服务器发送请求"""
-    if ADDRESS:
-        try:
-            headers = make_header(bot_id, True, config.universal.access_token)
-            if isinstance(data, BaseEvent):
-                data = dataclass_to_dict(data)
-            logger.debug(f"向 HTTP Webhook 服务器推送事件：{data}")
-            async with AsyncClient(headers=headers) as http_client:
-                resp = await http_client.post(
-                    ADDRESS, json=data, timeout=TIMEOUT
-                )
-                resp.raise_for_status()
-        except ConnectError as e:
-            logger.warning(f"向 HTTP Webhook 服务器推送事件失败：{str(e)}")
-        except HTTPStatusError as e:
-            logger.warning(
-                f"向 HTTP Webhook 服务器推送事件失败：意外的状态码 {e.response.status_code}"
-            )
-
-
-async def push_event(client: Client, event: Event):
+async def push_event(event: EncodedEvent):
     """向 HTTP Webhook 服务器推送事件"""
-    bot_id = client.session.uin
-    if data := await cai_event_to_dataclass(bot_id, event):
-        if isinstance(data, BaseMessageEvent):
-            if id_ := save_message(data):
-                setattr(data, "message_id", id_)
-        await request(data=data, bot_id=bot_id)
+    if webhook_clients:
+        logger.debug(f"向 HTTP Webhook 服务器推送事件：{event.data}")
+        for webhook_client in webhook_router.route(event.data):
+            webhook_client.put(event.seq, event.text)
 
 
 @app.on_event("startup")
 async def startup():
-    global scheduler
-
-    scheduler = await init(push_event=push_event)
+    await init(push_event=push_event, heartbeat=False)
+    for webhook_client in webhook_clients:
+        webhook_client.start(config.account.uin)
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    global scheduler
-
-    await close(scheduler)
+    await asyncio.gather(
+        *[webhook_client.stop() for webhook_client in webhook_clients]
+    )
+    await close(push_event)
 
 
 async def depend_check_authorization(
@@ -127,14 +224,32 @@ async def depend_check_authorization(
 
 
 @app.post("/", dependencies=[Depends(depend_check_authorization)])
-async def root(request_model: RequestModel, content_type: str = Header()):
+async def root(
+    request: Request,
+    request_model: RequestModel,
+    content_type: str = Header(),
+):
     action = request_model.action
     if request_model.params:
         request_model.params.update(echo=request_model.echo)
         params = request_model.params
     else:
         params = {"echo": request_model.echo}
-    resp = await run_action(action, **params)
+    # HTTP 请求没有持久连接，按应用端 IP 及 X-Client-ID 请求头区分客户端，
+    # 同一主机上的多个应用端可通过 X-Client-ID 分别计算限额
+    client = f"http:{request.client.host if request.client else ''}"
+    if client_id := request.headers.get("X-Client-ID"):
+        client = f"{client}:{client_id}"
+    resp = await run_admitted(
+        client,
+        request_model.echo,
+        lambda: run_action(action, **params),
+        get_action_weight(action, params),
+    )
     if content_type in {"application/msgpack", "application/x-msgpack"}:
-        resp = MsgpackResponse(resp.dict())
-    return resp
+        return Response(
+            encode_response(resp, True), media_type="application/msgpack"
+        )
+    return Response(
+        encode_response(resp, False), media_type="application/json"
+    )
@@ -0,0 +1,66 @@
+"""
+OneBot CAI 事件路由模块
+
+分片模式下使用最高随机权重（Rendezvous）哈希，将会话（群聊为 group_id，私聊为 user_id）
+稳定地分配给其中一个推送地址。
+
+推送地址列表在启动时确定，调整推送地址列表（增加、删除地址）需修改配置并重启，
+重启后只有分配给被删除地址的会话，以及被新地址抢占的会话会改变归属（约 1/n），
+其余会话的归属保持不变。推送地址的分片标识默认为其地址，不能重复，
+如需更换地址而不影响分片，可为其配置固定的 `shard_key`。
+"""
+from hashlib import blake2b
+from typing import Dict, List, Tuple, Union, Generic, TypeVar, Optional
+
+from ..config.config import EventRoute
+
+T = TypeVar("T")
+
+
+def get_shard_key(data: dict) -> Optional[str]:
+    """获取事件的分片键，元事件等无会话的事件返回 None"""
+    if (group_id := data.get("group_id")) is not None:
+        return f"group:{group_id}"
+    elif (user_id := data.get("user_id")) is not None:
+        return f"private:{user_id}"
+
+
+def _weight(endpoint_key: str, shard_key: str) -> int:
+    digest = blake2b(
+        f"{endpoint_key}\0{shard_key}".encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big")
+
+
+class EventRouter(Generic[T]):
+    """事件路由器"""
+
+    def __init__(
+        self,
+        route: Union[EventRoute, str],
+        endpoints: List[Tuple[str, T]],
+    ):
+        """
+        route 路由方式
+        endpoints 推送地址列表，每项为（分片标识，推送地址），分片标识不能重复
+        """
+        self.route_way = EventRoute(route)
+        self.endpoints: Dict[str, T] = {}
+        for key, endpoint in endpoints:
+            if key in self.endpoints:
+                raise ValueError(f"推送地址的分片标识重复：{key}")
+            self.endpoints[key] = endpoint
+
+    def owner(self, shard_key: str) -> str:
+        """获取会话所属推送地址的分片标识"""
+        return max(self.endpoints, key=lambda key: _weight(key, shard_key))
+
+    def route(self, data: dict) -> List[T]:
+        """获取事件应推送到的地址"""
+        if (
+            self.route_way == EventRoute.SHARD
+            and self.endpoints
+            and (shard_key := get_shard_key(data))
+        ):
+            return [self.endpoints[self.owner(shard_key)]]
+        return list(self.endpoints.values())
@@ -18,6 +18,8 @@ STATUS = {
     20002: "Internal Handler Error",
     31000: "Message is Not in Database",  # 数据库未找到消息
     31001: "File is Not in Database",  # 数据库未找到文件
+    32000: "Action Timeout",  # 动作执行超时
+    32001: "Too Many Requests",  # 动作请求过多，已拒绝
     33000: "Can't Download Images",  # 图片无法下载
     34000: "Can't Send Message",  # 由于风控等未知原因无法发送消息
     34001: "Bot was muted",  # 机器人被禁言
@@ -80,3 +82,11 @@ class FailedInfo(SuccessRequest):
     """动作执行失败"""
 
     status: str = "failed"
+
+
+class TargetResponse(SuccessRequest):
+    """向多个目标发送消息时单个目标的发送结果"""
+
+    detail_type: str
+    group_id: Optional[int] = None
+    user_id: Optional[int] = None
@@ -0,0 +1,201 @@
+"""
+OneBot CAI Unix 套接字模块
+
+适用于与 OneBot CAI 运行在同一主机的应用端，省去 TCP 回环与 HTTP/WebSocket 协议开销。
+
+每帧由 4 字节大端序无符号整数表示的长度和数据组成，数据为 JSON 或 MessagePack 编码的
+动作请求、动作响应或事件，与正向 WebSocket 相同。
+动作响应使用与请求相同的编码，事件使用配置的编码。
+每个连接的事件由独立的写任务发送，事件队列已满的连接将被断开，不会拖慢其他连接。
+连接不进行鉴权，请通过套接字文件权限控制访问。
+"""
+import os
+import signal
+import asyncio
+import contextlib
+from json import loads
+from pathlib import Path
+from itertools import count
+from typing import Set, Union, Optional
+
+from msgpack import unpackb
+
+from ..log import logger
+from ..config import config
+from .status import STATUS, FailedInfo
+from .bus import EncodedEvent, init, close
+from .utils import ActionDispatcher, encode_response
+
+HEADER_SIZE = 4
+"""帧长度头字节数"""
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+"""最大帧长度"""
+EVENT_QUEUE_SIZE = 1024
+"""每个连接待发送的最大事件数，超出时断开该连接"""
+JSON_LEADS = (b"{", b"\xef")
+"""JSON 动作请求去除前导空白后可能的首字节（对象起始或 UTF-8 BOM）"""
+
+if not (UNIX := config.unix):
+    raise RuntimeError
+PATH = Path(UNIX.path)
+USE_MSGPACK = UNIX.encoding == "msgpack"
+MAX_CONCURRENT_ACTIONS = UNIX.max_concurrent_actions or 16
+should_exit = asyncio.Event()
+connection_ids = count(1)
+"""连接编号，用于区分准入控制的客户端"""
+
+
+def pack_frame(data: Union[str, bytes]) -> bytes:
+    """为数据加上长度头"""
+    if isinstance(data, str):
+        data = data.encode()
+    return len(data).to_bytes(HEADER_SIZE, "big") + data
+
+
+class UnixConnection:
+    """Unix 套接字连接"""
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.dispatcher = ActionDispatcher(
+            self.send, MAX_CONCURRENT_ACTIONS, f"unix:{next(connection_ids)}"
+        )
+        self.events: "asyncio.Queue[bytes]" = asyncio.Queue(EVENT_QUEUE_SIZE)
+        self.event_writer: Optional[asyncio.Task] = None
+
+    async def send(self, data: Union[str, bytes]):
+        """发送一帧"""
+        self.writer.write(pack_frame(data))
+        await self.writer.drain()
+
+    def push(self, frame: bytes):
+        """将已编码的事件加入发送队列，队列已满时断开连接"""
+        try:
+            self.events.put_nowait(frame)
+        except asyncio.QueueFull:
+            logger.warning("Unix 套接字客户端接收事件过慢，断开连接")
+            # 发送缓冲区未清空时 close() 不会断开连接，直接中止
+            self.writer.transport.abort()
+
+    async def write_events(self):
+        """依次发送事件队列中的事件"""
+        with contextlib.suppress(ConnectionError):
+            while True:
+                frame = await self.events.get()
+                async with self.dispatcher.lock:
+                    await self.send(frame)
+
+    def close(self):
+        """断开连接，取消执行中的动作"""
+        self.dispatcher.cancel_all()
+        if self.event_writer is not None:
+            self.event_writer.cancel()
+        self.writer.close()
+
+    async def reply_invalid(self, is_msgpack: bool):
+        """回复无法解析的动作请求"""
+        resp = FailedInfo(
+            retcode=10001, echo=None, message=STATUS[10001], data=None
+        )
+        async with self.dispatcher.lock:
+            await self.send(encode_response(resp, is_msgpack))
+
+    async def serve(self):
+        """读取动作请求直至连接断开"""
+        self.event_writer = asyncio.create_task(self.write_events())
+        try:
+            while True:
+                header = await self.reader.readexactly(HEADER_SIZE)
+                length = int.from_bytes(header, "big")
+                if length > MAX_FRAME_SIZE:
+                    logger.warning(f"Unix 套接字帧过大（{length} 字节），断开连接")
+                    break
+                payload = await self.reader.readexactly(length)
+                # JSON 动作请求为对象，去除前导空白后以 { 或 UTF-8 BOM 开头，
+                # 二者均不是 MessagePack 映射的首字节
+                is_msgpack = payload.lstrip()[:1] not in JSON_LEADS
+                try:
+                    data = unpackb(payload) if is_msgpack else loads(payload)
+                except ValueError:  # 包括 JSON 与 MessagePack 的解码错误
+                    data = None
+                if not isinstance(data, dict):
+                    await self.reply_invalid(is_msgpack)
+                    continue
+                await self.dispatcher.dispatch(data, is_msgpack)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.close()
+
+
+class ConnectionManager:
+    """连接管理器"""
+
+    def __init__(self):
+        self.active_connections: Set[UnixConnection] = set()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """处理新连接"""
+        connection = UnixConnection(reader, writer)
+        self.active_connections.add(connection)
+        logger.info("Unix 套接字客户端已连接")
+        try:
+            await connection.serve()
+        finally:
+            self.active_connections.discard(connection)
+            logger.info("Unix 套接字客户端已断开")
+
+    async def broadcast(self, event: EncodedEvent):
+        """广播 Event"""
+        if not self.active_connections:
+            return
+        logger.debug(f"向 Unix 套接字客户端推送事件：{event.data}")
+        frame = event.msgpack if USE_MSGPACK else event.binary
+        for connection in list(self.active_connections):
+            connection.push(frame)
+
+
+manager = ConnectionManager()
+
+
+async def push_event(event: EncodedEvent):
+    """推送事件"""
+    await manager.broadcast(event)
+
+
+def stop():
+    """关闭 Unix 套接字服务"""
+    should_exit.set()
+
+
+async def run(install_signal_handlers: bool = True):
+    """
+    运行入口
+
+    install_signal_handlers 是否注册停止信号处理，同时运行多种连接方式时由调用方处理
+    """
+    if PATH.is_socket():
+        PATH.unlink()
+    server = await asyncio.start_unix_server(manager.handle, path=str(PATH))
+    # umask 为进程级设置，改为绑定后修改套接字文件权限
+    os.chmod(PATH, UNIX.permissions)
+    logger.info(f"Unix 套接字监听于 {PATH}")
+    await init(push_event=push_event)
+
+    if install_signal_handlers:
+        loop = asyncio.get_running_loop()
+        for sign in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sign, stop)
+    async with server:
+        await should_exit.wait()
+    logger.info("Unix 套接字服务正在关闭")
+    for connection in list(manager.active_connections):
+        connection.close()
+    with contextlib.suppress(FileNotFoundError):
+        PATH.unlink()
+    await close(push_event)
@@ -1,26 +1,40 @@
 """OneBot CAI 连接通用模块"""
-from typing import Any, Callable, Optional
+import asyncio
+import tempfile
+from enum import Enum
+from os import SEEK_END
+from base64 import b64encode
+from json import JSONEncoder
+from collections import deque
+from typing import (
+    IO,
+    Any,
+    Set,
+    Dict,
+    Deque,
+    Tuple,
+    Union,
+    Callable,
+    Optional,
+    Awaitable,
+)
 
-from msgpack import packb
+from msgpack import Packer, packb
 from fastapi import FastAPI, Request
-from pydantic import ValidationError
 from starlette.exceptions import HTTPException
+from pydantic import BaseModel, ValidationError
 from starlette.background import BackgroundTask
 from fastapi.responses import Response, JSONResponse
 from fastapi.exceptions import RequestValidationError
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from ..log import logger
 from ..config import config
 from .models import RequestModel
-from ..utils.database import database
-from ..run import get_client, run_action
-from ..models.message import DatabaseMessage
-from ..models.event import (
-    BaseMessageEvent,
-    GroupMessageEvent,
-    PrivateMessageEvent,
-)
+from ..utils.metrics import metrics
+from ..config.config import OverflowPolicy
+from ..run import run_action, resolve_action
+from ..utils.validator import compile_validator
+from ..utils.admission import AdmissionController
 from .status import (
     STATUS,
     ERROR_HTTP_REQUEST_MESSAGE,
@@ -29,6 +43,17 @@ from .status import (
 )
 
 SECRET = config.universal.access_token
+validate_request = compile_validator(RequestModel)
+"""动作请求的预编译校验函数"""
+ACTION = config.action
+admission = AdmissionController(
+    64 if ACTION.max_concurrency is None else ACTION.max_concurrency,
+    16 if ACTION.client_concurrency is None else ACTION.client_concurrency,
+    100 if ACTION.client_queue_size is None else ACTION.client_queue_size,
+)
+"""动作准入控制器，各连接方式共用"""
+BATCH_CONCURRENCY = config.universal.batch_concurrency or 8
+"""批量动作同时执行的最大动作数"""
 
 
 class MsgpackResponse(Response):
@@ -48,42 +73,79 @@ class MsgpackResponse(Response):
         return packb(content)
 
 
-async def init(
-    push_event: Callable, heartbeat: Optional[Callable] = None
-) -> Optional[AsyncIOScheduler]:
-    """初始化 QQ 会话和心跳"""
-    client = get_client()
-    if client:
-        logger.debug(f"注册事件监听：{push_event}")
-        client.add_event_listener(push_event)
-
-    if heartbeat and (heartbeat_config := config.heartbeat):
-        if heartbeat_config.enabled:
-            scheduler = AsyncIOScheduler()
-            interval = heartbeat_config.interval
-            if not interval:
-                interval = 3000
-            scheduler.add_job(
-                heartbeat,
-                "cron",
-                name="heartbeat",
-                second=f"*/{int(interval / 1000)}",
-                args=[config.account.uin, interval],
-                timezone=config.universal.timezone,
+def _default(obj: Any) -> Any:
+    """将 JSON 与 MessagePack 不支持的对象转为基本类型"""
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    elif isinstance(obj, Enum):
+        return obj.value
+    elif isinstance(obj, bytes):  # OneBot 12 中 JSON 的 bytes 使用 Base64 编码
+        return b64encode(obj).decode()
+    return str(obj)  # Path、UUID 等
+
+
+_json_encoder = JSONEncoder(
+    ensure_ascii=False, separators=(",", ":"), default=_default
+)
+_msgpack_packer = Packer(default=_default)
+
+
+def _pre_encode_failures() -> Tuple[Dict[int, str], Dict[int, bytes]]:
+    """预编码常见失败响应的除 echo 以外的字段"""
+    json_failures, msgpack_failures = {}, {}
+    for retcode in (10001, 10002, 10003, 20002, 32001, 34000, 34099):
+        envelope = {
+            "status": "failed",
+            "retcode": retcode,
+            "data": None,
+            "message": STATUS[retcode],
+        }
+        json_failures[retcode] = _json_encoder.encode(envelope)[:-1]
+        # 将映射长度由 4 改为 5，echo 在编码时追加
+        msgpack_failures[retcode] = b"\x85" + packb(envelope)[1:]
+    return json_failures, msgpack_failures
+
+
+_json_failures, _msgpack_failures = _pre_encode_failures()
+
+
+def encode_response(
+    resp: SuccessRequest, is_msgpack: bool
+) -> Union[str, bytes]:
+    """
+    将动作响应直接编码为 JSON 字符串或 MessagePack 二进制数据
+
+    不经过 FastAPI 的 jsonable_encoder 和 pydantic 的 dict()
+    """
+    if (
+        resp.data is None
+        and resp.status == "failed"
+        and resp.retcode in _json_failures
+        and resp.message == STATUS[resp.retcode]
+    ):
+        if is_msgpack:
+            return (
+                _msgpack_failures[resp.retcode]
+                + _msgpack_packer.pack("echo")
+                + _msgpack_packer.pack(resp.echo)
             )
-            scheduler.start()
-            return scheduler
+        return (
+            f"{_json_failures[resp.retcode]},"
+            f'"echo":{_json_encoder.encode(resp.echo)}}}'
+        )
+    if is_msgpack:
+        return _msgpack_packer.pack(resp)
+    return _json_encoder.encode(resp)
 
 
 async def run_action_by_dict(data: dict) -> SuccessRequest:
     """根据 dict 执行动作"""
     echo = data.get("echo")
     try:
-        request_model = RequestModel(**data)
+        request_model = validate_request(data)
         action = request_model.action
         if request_model.params:
-            request_model.params.update(echo=request_model.echo)
-            params = request_model.params
+            params = dict(request_model.params, echo=request_model.echo)
         else:
             params = {"echo": request_model.echo}
         resp = await run_action(action, **params)
@@ -95,25 +157,221 @@ async def run_action_by_dict(data: dict) -> SuccessRequest:
     return resp
 
 
-def save_message(event: BaseMessageEvent) -> Optional[str]:
-    save_msg = None
-    if isinstance(event, GroupMessageEvent):
-        save_msg = DatabaseMessage(
-            msg=event.message,
-            time=int(event.time),
-            seq=event.__seq__,
-            group=event.group_id,
-            rand=event.__rand__,
+def get_action_weight(action: Any, params: Any) -> int:
+    """
+    动作占用的准入名额数
+
+    qq.batch 按同时执行的子动作数计，其余动作为 1
+    """
+    if (
+        not isinstance(action, str)
+        or not isinstance(params, dict)
+        or resolve_action(action)[0] != "qq.batch"
+        or params.get("sequential")
+        or not isinstance(requests := params.get("requests"), list)
+    ):
+        return 1
+    limit = BATCH_CONCURRENCY
+    if isinstance(concurrency := params.get("concurrency"), int):
+        limit = max(1, min(concurrency, limit))
+    return max(1, min(len(requests), limit))
+
+
+async def run_admitted(
+    client: str,
+    echo: Optional[str],
+    run: Callable[[], Awaitable[SuccessRequest]],
+    weight: int = 1,
+) -> SuccessRequest:
+    """
+    经准入控制执行动作
+
+    client 客户端标识
+    echo 请求的 echo，被拒绝时原样返回
+    run 执行动作的函数，获得名额后才调用
+    weight 占用的名额数，见 `get_action_weight`
+    """
+    if await admission.acquire(client, weight) is None:
+        return FailedInfo(
+            retcode=32001, echo=echo, message=STATUS[32001], data=None
         )
-    elif isinstance(event, PrivateMessageEvent):
-        save_msg = DatabaseMessage(
-            msg=event.message,
-            time=int(event.time),
-            seq=event.__seq__,
-            user=event.user_id,
+    try:
+        return await run()
+    finally:
+        admission.release(client, weight)
+
+
+class ActionDispatcher:
+    """
+    WebSocket 连接动作调度器
+
+    每个动作作为独立任务执行，执行完成后立即发送响应（由 echo 对应请求），
+    并通过写锁保证帧不会交错。连接断开时应调用 `cancel_all` 取消执行中的动作
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Union[str, bytes]], Awaitable[Any]],
+        concurrency: int,
+        client: str,
+    ):
+        """
+        send 发送帧的函数
+        concurrency 同时执行的最大动作数
+        client 客户端标识，用于准入控制
+        """
+        self.send = send
+        self.client = client
+        self.lock = asyncio.Lock()
+        """写锁，推送事件时也应持有"""
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def dispatch(self, data: dict, is_msgpack: bool):
+        """调度动作，达到并发上限时等待，从而暂停读取新帧"""
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._run(data, is_msgpack))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def cancel_all(self):
+        """取消所有执行中的动作，用于连接断开时释放资源"""
+        if self.tasks:
+            logger.debug(f"连接已断开，取消 {len(self.tasks)} 个执行中的动作")
+        for task in self.tasks:
+            task.cancel()
+
+    async def _run(self, data: dict, is_msgpack: bool):
+        try:
+            resp = await run_admitted(
+                self.client,
+                data.get("echo"),
+                lambda: run_action_by_dict(data),
+                get_action_weight(data.get("action"), data.get("params")),
+            )
+            frame = encode_response(resp, is_msgpack)
+            async with self.lock:
+                await self.send(frame)
+        except Exception as e:
+            logger.warning(f"发送动作响应失败：{str(e)}")
+        finally:
+            self.semaphore.release()
+
+
+class EventQueue:
+    """
+    有界事件队列，元素为（事件序号，已编码的事件）
+
+    队列已满时按溢出策略处理新事件：
+    drop_oldest 丢弃最旧的事件，drop_newest 丢弃新事件，
+    spill 将新事件写入临时文件，内存中的事件取完后再按顺序读回
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        overflow: Union[OverflowPolicy, str],
+        endpoint: str,
+        metric_prefix: str = "ws_reverse",
+    ):
+        """
+        maxsize 内存中的最大事件数，0 表示不限大小
+        overflow 溢出策略
+        endpoint 推送地址，用于指标标签
+        metric_prefix 指标名前缀
+        """
+        self.maxsize = maxsize
+        self.overflow = OverflowPolicy(overflow)
+        self.endpoint = endpoint
+        self.metric_prefix = metric_prefix
+        self._items: Deque[Tuple[int, str]] = deque()
+        self._not_empty = asyncio.Event()
+        self._spill: Optional[IO[bytes]] = None
+        self._spilled = 0
+        """临时文件中尚未读回的事件数"""
+        self._spill_offset = 0
+        """临时文件读取位置"""
+
+    def __len__(self) -> int:
+        return len(self._items) + self._spilled
+
+    def _update_metrics(self):
+        metrics.set(
+            f"{self.metric_prefix}_queue_depth",
+            len(self),
+            endpoint=self.endpoint,
+        )
+        metrics.set(
+            f"{self.metric_prefix}_queue_spilled",
+            self._spilled,
+            endpoint=self.endpoint,
+        )
+
+    def _drop(self, seq: int):
+        logger.debug(f"事件队列已满（{self.endpoint}），丢弃事件 {seq}")
+        metrics.inc(
+            f"{self.metric_prefix}_events_dropped", endpoint=self.endpoint
         )
-    if save_msg:
-        return database.save_message(save_msg)
+
+    def _spill_write(self, seq: int, event: str):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+            logger.info(f"事件队列已满（{self.endpoint}），新事件将暂存至临时文件")
+        self._spill.seek(0, SEEK_END)
+        # JSON 编码结果不含换行符，可按行分隔
+        self._spill.write(f"{seq} {event}\n".encode())
+        self._spilled += 1
+
+    def _spill_read(self):
+        """从临时文件读回至多 maxsize 个事件"""
+        assert self._spill is not None
+        self._spill.seek(self._spill_offset)
+        for _ in range(min(self.maxsize, self._spilled)):
+            seq, event = (
+                self._spill.readline().decode().rstrip("\n").split(" ", 1)
+            )
+            self._items.append((int(seq), event))
+            self._spilled -= 1
+        self._spill_offset = self._spill.tell()
+        if not self._spilled:
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_offset = 0
+
+    def put(self, seq: int, event: str):
+        """加入事件，不会等待"""
+        if self.maxsize and (
+            self._spilled or len(self._items) >= self.maxsize
+        ):
+            if self.overflow == OverflowPolicy.SPILL:
+                self._spill_write(seq, event)
+            elif self.overflow == OverflowPolicy.DROP_NEWEST:
+                self._drop(seq)
+            else:
+                self._drop(self._items.popleft()[0])
+                self._items.append((seq, event))
+        else:
+            self._items.append((seq, event))
+        self._not_empty.set()
+        self._update_metrics()
+
+    async def get(self) -> Tuple[int, str]:
+        """取出最旧的事件，队列为空时等待"""
+        while not len(self):
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        if not self._items:
+            self._spill_read()
+        item = self._items.popleft()
+        self._update_metrics()
+        return item
+
+    def close(self):
+        """关闭临时文件"""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            self._spilled = self._spill_offset = 0
 
 
 def check_authorization(authorization: Optional[str] = None) -> bool:
@@ -1,38 +1,28 @@
 """OneBot CAI 正向 WebSocket 模块"""
-from time import time
 from json import loads
-from uuid import uuid4
-from typing import List, Union, Optional
+from typing import Dict, Union
 
 from fastapi import FastAPI
-from cai.api.client import Client
-from msgpack import packb, unpackb
-from cai.client.events.base import Event
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from msgpack import unpackb
 from starlette.websockets import WebSocket, WebSocketDisconnect
 
-from ..run import close
 from ..log import logger
 from ..config import config
-from ..msg.event import cai_event_to_dataclass
-from .utils import init, save_message, run_action_by_dict
-from ..models.event import (
-    BaseEvent,
-    HeartbeatEvent,
-    BaseMessageEvent,
-    dataclass_to_dict,
-)
+from .utils import ActionDispatcher
+from .bus import EncodedEvent, init, close
 
 app = FastAPI()
-scheduler: Optional[AsyncIOScheduler]
 SECRET = config.universal.access_token
+MAX_CONCURRENT_ACTIONS = (
+    config.ws.max_concurrent_actions if config.ws else None
+) or 16
 
 
 class ConnectionManager:
     """连接管理器"""
 
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Dict[WebSocket, ActionDispatcher] = {}
 
     async def connect(self, websocket: WebSocket) -> bool:
         """与 WebSocket 客户端建立连接"""
@@ -49,29 +39,40 @@ class ConnectionManager:
                 await websocket.close(401)  # bug: will return 403
                 return False
         await websocket.accept()
-        self.active_connections.append(websocket)
+
+        async def send(data: Union[str, bytes]):
+            if isinstance(data, bytes):
+                await websocket.send_bytes(data)
+            else:
+                await websocket.send_text(data)
+
+        peer = websocket.client
+        self.active_connections[websocket] = ActionDispatcher(
+            send,
+            MAX_CONCURRENT_ACTIONS,
+            f"ws:{peer.host}:{peer.port}" if peer else f"ws:{id(websocket)}",
+        )
         return True
 
     def disconnect(self, websocket: WebSocket):
         """与 WebSocket 客户端断开连接"""
-        self.active_connections.remove(websocket)
+        self.active_connections.pop(websocket, None)
 
     # @staticmethod
     # async def request(message: str, websocket: WebSocket):
     #     """向 WebSocket 客户端发送请求"""
     #     await websocket.send_json(message)
 
-    async def broadcast(self, data: Union[BaseEvent, dict]):
+    async def broadcast(self, event: EncodedEvent):
         """广播 Event"""
-        if isinstance(data, BaseEvent):
-            data = dataclass_to_dict(data)
-        for connection in self.active_connections:
+        for connection, dispatcher in list(self.active_connections.items()):
             if address := connection.client:
                 logger.debug(
                     f"向正向 WebSocket 客户端 {address.host}:{address.port} "
-                    f"推送事件：{data}"
+                    f"推送事件：{event.data}"
                 )
-                await connection.send_json(data)
+                async with dispatcher.lock:
+                    await connection.send_text(event.text)
 
 
 manager = ConnectionManager()
@@ -79,22 +80,19 @@ manager = ConnectionManager()
 
 @app.on_event("startup")
 async def startup():
-    global scheduler
-
-    scheduler = await init(push_event=push_event, heartbeat=heartbeat)
+    await init(push_event=push_event)
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    global scheduler
-
-    await close(scheduler)
+    await close(push_event)
 
 
 @app.websocket("/")
 async def root(websocket: WebSocket):
     if not await manager.connect(websocket):
         return
+    dispatcher = manager.active_connections[websocket]
     try:
         while True:
             message = await websocket.receive()
@@ -105,34 +103,14 @@ async def root(websocket: WebSocket):
             else:
                 is_msgpack = True
                 data = unpackb(message["bytes"])
-            print(data)
-            resp = (await run_action_by_dict(data)).dict()
-            if is_msgpack:
-                pack = packb(resp)
-                await websocket.send_bytes(pack)  # type: ignore
-            else:
-                await websocket.send_json(resp)
+            await dispatcher.dispatch(data, is_msgpack)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
+        dispatcher.cancel_all()
 
 
-async def push_event(client: Client, event: Event):
+async def push_event(event: EncodedEvent):
     """推送事件"""
-    bot_id = client.session.uin
-    if data := await cai_event_to_dataclass(bot_id, event):
-        if isinstance(data, BaseMessageEvent):
-            if id_ := save_message(data):
-                setattr(data, "message_id", id_)
-        await manager.broadcast(data)
-
-
-async def heartbeat(bot_id: int, interval: int):
-    """心跳服务"""
-    await manager.broadcast(
-        data=HeartbeatEvent(
-            id=str(uuid4()),
-            time=time(),
-            self_id=bot_id,
-            interval=interval,
-        )
-    )
+    await manager.broadcast(event)
@@ -2,33 +2,26 @@
 import signal
 import asyncio
 import contextlib
-from time import time
+from json import loads
 from uuid import uuid4
-from json import dumps, loads
-from typing import Union, Optional
-
-from cai import Client
-from msgpack import packb, unpackb
-from cai.client.events.base import Event
-from websockets.legacy.client import connect
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from random import uniform
+from collections import deque
+from typing import Deque, Tuple, Union
+
+from msgpack import unpackb
+from websockets.legacy.client import WebSocketClientProtocol, connect
 from websockets.exceptions import ConnectionClosed, WebSocketException
 
-from ..run import close
 from ..log import logger
 from ..config import config
-from ..const import make_header
+from .router import EventRouter
 from .exception import RunComplete
-from ..msg.event import cai_event_to_dataclass
-from .utils import init, save_message, run_action_by_dict
-from ..models.event import (
-    BaseEvent,
-    HeartbeatEvent,
-    BaseMessageEvent,
-    dataclass_to_dict,
-)
+from ..utils.metrics import metrics
+from ..config.config import OverflowPolicy
+from .bus import EncodedEvent, init, close
+from .utils import EventQueue, ActionDispatcher
+from ..const import RESUME_SEQ_HEADER, RESUME_SESSION_HEADER, make_header
 
-scheduler: Optional[AsyncIOScheduler]
 SECRET = config.universal.access_token
 
 
@@ -60,29 +53,91 @@ task_manager = TaskManager()
 
 
 class WebSocketClient:
-    def __init__(self, address, interval: int):
+    def __init__(
+        self,
+        address,
+        interval: int,
+        max_interval: int,
+        buffer_size: int,
+        max_concurrent_actions: int,
+        queue_size: int,
+        queue_overflow: Union[OverflowPolicy, str],
+    ):
         """初始化反向 WebSocket 客户端"""
         self.address = address
-        self._event_queues = set()
+        self.event_queue = EventQueue(queue_size, queue_overflow, address)
+        """待发送事件队列，断线重连时保留"""
         self.is_close = False
+        self.connected = False
         self.interval = interval
+        self.max_interval = max(max_interval, interval)
+        self.max_concurrent_actions = max_concurrent_actions
         self.tasks = []
+        self.session_id = str(uuid4())
+        """断线续传会话 ID，每次启动时生成"""
+        self._sent_seq = 0
+        """最后成功发送的事件序号"""
+        self._replay: Deque[Tuple[int, str]] = deque(maxlen=buffer_size)
+        """断线重放窗口"""
+
+    def _backoff(self, attempt: int) -> float:
+        """计算第 attempt 次重连的等待时间（毫秒），指数退避并加入随机抖动"""
+        delay = min(self.interval * 2**attempt, self.max_interval)
+        return uniform(delay / 2, delay)
+
+    def _resume_seq(self, websocket: WebSocketClientProtocol) -> int:
+        """从握手响应获取服务器最后收到的事件序号，服务器不支持则使用最后发送的序号"""
+        seq = websocket.response_headers.get(RESUME_SEQ_HEADER)
+        with contextlib.suppress(TypeError, ValueError):
+            return min(int(seq), self._sent_seq)  # type: ignore
+        return self._sent_seq
+
+    async def _replay_events(
+        self,
+        websocket: WebSocketClientProtocol,
+        lock: asyncio.Lock,
+        last_seq: int,
+    ):
+        """重发服务器未收到的事件"""
+        events = [(seq, data) for seq, data in self._replay if seq > last_seq]
+        if events:
+            logger.info(
+                f"向反向 WebSocket 服务器重发 {len(events)} 个事件"
+                f"（序号 {events[0][0]} 至 {events[-1][0]}）"
+            )
+        for seq, data in events:
+            async with lock:
+                await websocket.send(data)
+            self._sent_seq = seq
+            metrics.inc("ws_reverse_events_replayed", endpoint=self.address)
 
     async def run(self, bot_id: int):
         """运行反向 WebSocket 服务"""
-        event_queue = asyncio.Queue()
-        self._event_queues.add(event_queue)
+        attempt = 0
 
         while not self.is_close:
             try:
                 headers = make_header(
                     bot_id, False, config.universal.access_token
                 )
+                headers[RESUME_SESSION_HEADER] = self.session_id
+                headers[RESUME_SEQ_HEADER] = str(self._sent_seq)
                 logger.info(f"尝试连接反向 WebSocket 服务器：{self.address}")
                 async with connect(
                     self.address, extra_headers=headers
                 ) as websocket:
                     logger.success(f"成功连接反向 WebSocket 服务器：" f"{self.address}")
+                    attempt = 0
+                    self.connected = True
+                    metrics.set(
+                        "ws_reverse_connected", 1, endpoint=self.address
+                    )
+                    last_seq = self._resume_seq(websocket)
+                    dispatcher = ActionDispatcher(
+                        websocket.send,
+                        self.max_concurrent_actions,
+                        f"ws_reverse:{self.address}",
+                    )
                     try:
 
                         async def receive():
@@ -92,32 +147,37 @@ class WebSocketClient:
                                 data = (
                                     loads(recv) if is_json else unpackb(recv)
                                 )
-                                result = (
-                                    await run_action_by_dict(data)
-                                ).dict()
-                                resp = (
-                                    dumps(result) if is_json else packb(result)
-                                )
-                                await websocket.send(resp)  # type: ignore
+                                await dispatcher.dispatch(data, not is_json)
 
                         async def send():
+                            await self._replay_events(
+                                websocket, dispatcher.lock, last_seq
+                            )
                             while True:
-                                event = await event_queue.get()
+                                seq, event = await self.event_queue.get()
+                                if seq <= self._sent_seq:  # 已重发
+                                    continue
                                 logger.debug(f"向反向 WebSocket 服务器推送事件：{event}")
-                                await websocket.send(dumps(event))
+                                async with dispatcher.lock:
+                                    await websocket.send(event)
+                                self._sent_seq = seq
+                                metrics.inc(
+                                    "ws_reverse_events_sent",
+                                    endpoint=self.address,
+                                )
 
                         async def gather():
                             await asyncio.gather(send(), receive())
 
-                        await task_manager.task(gather, None)
+                        try:
+                            await task_manager.task(gather, None)
+                        finally:
+                            dispatcher.cancel_all()
                         # loop = asyncio.get_event_loop()
                         # for i in (send(), receive()):
                         #     self.tasks.append(loop.create_task(i))
                     except ConnectionClosed as e:
-                        logger.warning(
-                            f"反向 WebSocket 连接断开：{str(e)}，将于"
-                            f"{self.interval}毫秒后重连"
-                        )
+                        logger.warning(f"反向 WebSocket 连接断开：{str(e)}")
                     except RunComplete:
                         break
                     except Exception:
@@ -126,82 +186,107 @@ class WebSocketClient:
                 WebSocketException,
                 ConnectionRefusedError,
             ) as e:
-                logger.warning(
-                    f"无法连接到反向 WebSocket 服务器：{str(e)}，将于"
-                    f"{self.interval}毫秒后重连"
-                )
+                logger.warning(f"无法连接到反向 WebSocket 服务器：{str(e)}")
+            self.connected = False
+            metrics.set("ws_reverse_connected", 0, endpoint=self.address)
             if not self.is_close:
-                await task_manager.sleep(self.interval / 1000)
+                metrics.inc("ws_reverse_reconnects", endpoint=self.address)
+                delay = self._backoff(attempt)
+                attempt += 1
+                logger.info(f"将于 {int(delay)} 毫秒后重连反向 WebSocket 服务器")
+                await task_manager.sleep(delay / 1000)
         # close
         await self.close()
 
     async def close(self):
+        """关闭连接任务"""
         for task in self.tasks:
             if not task.done():
                 task.cancel()
-        """关闭心跳和 QQ 服务"""
-        await close(scheduler)
-
-    async def request(self, data: Union[BaseEvent, dict]):
-        """将请求加入队列"""
-        with contextlib.suppress(asyncio.exceptions.CancelledError):
-            if isinstance(data, BaseEvent):
-                data = dataclass_to_dict(data)
-            await asyncio.gather(
-                *[queue.put(data) for queue in self._event_queues]
-            )
-
-    async def push_event(self, client: Client, event: Event) -> None:
-        """推送 Event"""
-        if data := await cai_event_to_dataclass(client.session.uin, event):
-            if isinstance(data, BaseMessageEvent):
-                if id_ := save_message(data):
-                    setattr(data, "message_id", id_)
-            event_data = dataclass_to_dict(data)
-            await self.request(event_data)
-
-
-if not (CONNECT := config.ws_reverse):
+        self.event_queue.close()
+
+    def put(self, seq: int, event: str, is_meta: bool):
+        """
+        将已编码的事件加入队列
+
+        seq 事件序号
+        event 已编码的事件
+        is_meta 是否为元事件，元事件不加入断线重放窗口，断线期间直接丢弃
+        """
+        if is_meta:
+            if self.connected:
+                self.event_queue.put(seq, event)
+            return
+        self._replay.append((seq, event))
+        self.event_queue.put(seq, event)
+
+
+websocket_clients = [
+    WebSocketClient(
+        connect_config.url,
+        connect_config.reconnect_interval or 3000,
+        connect_config.reconnect_max_interval or 60000,
+        1000
+        if connect_config.replay_buffer_size is None
+        else connect_config.replay_buffer_size,
+        connect_config.max_concurrent_actions or 16,
+        10000
+        if connect_config.queue_size is None
+        else connect_config.queue_size,
+        connect_config.queue_overflow,
+    )
+    for connect_config in config.ws_reverse
+]
+if not websocket_clients:
     raise RuntimeError
-URL = CONNECT.url
-INTERVAL = CONNECT.reconnect_interval or 3000
-websocket_client = WebSocketClient(URL, INTERVAL)
-push_event = websocket_client.push_event
-request = websocket_client.request
-
-
-async def heartbeat(bot_id: int, interval: int):
-    """心跳服务"""
-    await request(
-        data=HeartbeatEvent(
-            id=str(uuid4()),
-            time=time(),
-            self_id=bot_id,
-            interval=interval,
+websocket_router = EventRouter(
+    config.universal.event_route,
+    [
+        (connect_config.shard_key or str(connect_config.url), websocket_client)
+        for connect_config, websocket_client in zip(
+            config.ws_reverse, websocket_clients
         )
-    )
+    ],
+)
 
 
-async def run():
-    """运行入口"""
-    global scheduler
+async def push_event(event: EncodedEvent):
+    """将事件加入对应连接的队列"""
+    for websocket_client in websocket_router.route(event.data):
+        websocket_client.put(event.seq, event.text, event.is_meta)
+
+
+async def run(install_signal_handlers: bool = True):
+    """
+    运行入口
+
+    install_signal_handlers 是否注册停止信号处理，同时运行多种连接方式时由调用方处理
+    """
+    if install_signal_handlers:
+        for sign in (
+            signal.SIGINT,  # Unix kill -2(CTRL + C)
+            signal.SIGTERM,  # Unix kill -15
+        ):
+            signal.signal(sign, shutdown)
+    await init(push_event=push_event)
+    await asyncio.gather(
+        *[
+            websocket_client.run(config.account.uin)
+            for websocket_client in websocket_clients
+        ]
+    )
+    await close(push_event)
 
-    scheduler = await init(push_event=push_event, heartbeat=heartbeat)
-    task = asyncio.create_task(websocket_client.run(config.account.uin))
-    await asyncio.gather(task)
+
+def stop():
+    """关闭所有反向 WebSocket 连接"""
+    for websocket_client in websocket_clients:
+        websocket_client.is_close = True
+    task_manager.cancel_all()
 
 
 def shutdown(sig, frame):
     """关闭 OneBot CAI 入口"""
     logger.debug(f"收到停止信号：{sig}")
     logger.info("OneBot CAI 正在关闭")
-    websocket_client.is_close = True
-    task_manager.cancel_all()
-
-
-signs = {
-    signal.SIGINT,  # Unix kill -2(CTRL + C)
-    signal.SIGTERM,  # Unix kill -15
-}
-for sign in signs:
-    signal.signal(sign, shutdown)
+    stop()
@@ -15,6 +15,19 @@ PLATFORM = "qq"
 USER_AGENT = f"OneBot/{ONEBOT_VERSION} ({PLATFORM}) OneBot-CAI/{VERSION}"
 """OneBot UA 请求头"""
 
+# 以下为 OneBot CAI 扩展的常量
+RESUME_SESSION_HEADER = "X-QQ-Session-ID"
+"""反向 WebSocket 断线续传会话 ID 请求头"""
+RESUME_SEQ_HEADER = "X-QQ-Last-Seq"
+"""
+反向 WebSocket 断线续传序号请求头
+
+请求时为 OneBot CAI 最后发送的事件序号，
+服务器可在握手响应中以同名响应头返回其最后收到的事件序号
+"""
+EVENT_SEQ_FIELD = "qq.seq"
+"""事件序号扩展字段"""
+
 
 class Protocol(IntEnum):
     """QQ 登录协议枚举类"""
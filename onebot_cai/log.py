@@ -63,5 +63,10 @@ LOGGING_CONFIG = {
             "handlers": ["default"],
             "level": "INFO",
         },
+        "hypercorn.error": {"handlers": ["default"], "level": "INFO"},
+        "hypercorn.access": {
+            "handlers": ["default"],
+            "level": "INFO",
+        },
     },
 }
@@ -1,16 +1,150 @@
+import signal
+import asyncio
+import logging
 from os import getpid
+from typing import List, Tuple, Union, Callable, Optional, Awaitable
 
 from .config import config
+from .utils import runtime
 from .run import get_client
 from .run import init as cai_init
-from .config.config import ConnectWay
 from .log import LOGGING_CONFIG, logger
+from .config.config import ConnectWay, HTTPConfig, HTTPServer, WebSocketConfig
 
 
 async def login():
     return await cai_init(config.account.uin, config.account.password)
 
 
+def _http_server(
+    app: str,
+    section: Union[HTTPConfig, WebSocketConfig],
+    install_signal_handlers: bool = True,
+) -> Tuple[Awaitable, Callable[[], None]]:
+    """
+    创建 HTTP 服务器
+
+    app ASGI 应用导入路径
+    section 连接配置
+    install_signal_handlers 是否由服务器处理停止信号
+
+    返回：
+        Tuple(运行服务器的协程，停止服务器的函数)
+    """
+    host, port = section.host, section.port
+    server = getattr(section, "server", HTTPServer.UVICORN)
+    certfile = getattr(section, "ssl_certfile", None)
+    keyfile = getattr(section, "ssl_keyfile", None)
+    if server == HTTPServer.HYPERCORN:
+        from hypercorn.asyncio import serve
+        from uvicorn.importer import import_from_string
+        from hypercorn.config import Config as HypercornConfig
+
+        hypercorn_config = HypercornConfig()
+        hypercorn_config.bind = [f"{host}:{port}"]
+        hypercorn_config.certfile = certfile
+        hypercorn_config.keyfile = keyfile
+        hypercorn_config.logconfig_dict = LOGGING_CONFIG
+        hypercorn_config.errorlog = logging.getLogger("hypercorn.error")
+        hypercorn_config.accesslog = logging.getLogger("hypercorn.access")
+        logger.info(
+            "HTTP 服务器：Hypercorn（"
+            + ("HTTP/1.1、HTTP/2" if certfile else "HTTP/1.1、h2c")
+            + "）"
+        )
+        should_exit = asyncio.Event()
+        return (
+            serve(
+                import_from_string(app),
+                hypercorn_config,
+                # 未指定时由 Hypercorn 处理停止信号
+                shutdown_trigger=None
+                if install_signal_handlers
+                else should_exit.wait,  # type: ignore
+            ),
+            should_exit.set,
+        )
+
+    from uvicorn import Config, Server
+
+    uvicorn_config = Config(
+        app=app,
+        host=host,
+        port=port,
+        log_config=LOGGING_CONFIG,
+        http=runtime.http_impl,
+        ssl_certfile=certfile,
+        ssl_keyfile=keyfile,
+    )
+    uvicorn_server = Server(config=uvicorn_config)
+    if not install_signal_handlers:
+        uvicorn_server.install_signal_handlers = lambda: None  # type: ignore
+    return uvicorn_server.serve(), lambda: setattr(
+        uvicorn_server, "should_exit", True
+    )
+
+
+async def run_multiple():
+    """同时运行所有已配置的连接方式，停止信号由此统一处理"""
+    names: List[str] = []
+    tasks: List[Awaitable] = []
+    stops: List[Callable[[], None]] = []
+    sections: Tuple[
+        Tuple[str, str, Optional[Union[HTTPConfig, WebSocketConfig]]], ...
+    ] = (
+        ("HTTP", "onebot_cai.connect.http:app", config.http),
+        ("正向 WebSocket", "onebot_cai.connect.ws:app", config.ws),
+    )
+    for name, app, section in sections:
+        if section:
+            logger.info(f"连接方式：{name}")
+            serve, stop = _http_server(
+                app, section, install_signal_handlers=False
+            )
+            names.append(name)
+            tasks.append(serve)
+            stops.append(stop)
+    if config.ws_reverse:
+        from .connect import ws_reverse
+
+        names.append("反向 WebSocket")
+        tasks.append(ws_reverse.run(install_signal_handlers=False))
+        stops.append(ws_reverse.stop)
+        logger.info("连接方式：反向 WebSocket")
+    if config.unix:
+        from .connect import unix
+
+        names.append("Unix 套接字")
+        tasks.append(unix.run(install_signal_handlers=False))
+        stops.append(unix.stop)
+        logger.info("连接方式：Unix 套接字")
+    if not tasks:
+        logger.error("未配置任何连接方式")
+        return
+
+    def shutdown():
+        logger.info("OneBot CAI 正在关闭")
+        for stop in stops:
+            stop()
+
+    loop = asyncio.get_running_loop()
+    for sign in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sign, shutdown)
+    running = {
+        asyncio.ensure_future(task): name for name, task in zip(names, tasks)
+    }
+    done, pending = await asyncio.wait(
+        running, return_when=asyncio.FIRST_EXCEPTION
+    )
+    if pending:
+        # 某个连接方式异常退出时停止其余连接方式，避免进程只提供部分服务
+        shutdown()
+        await asyncio.wait(pending)
+    for task, name in running.items():
+        if not task.cancelled() and (exc := task.exception()):
+            logger.opt(exception=exc).error(f"连接方式 {name} 异常退出")
+
+
 async def main() -> bool:
     logger.info(f"OneBot CAI 运行于 PID {getpid()}")
     status = await login()
@@ -21,44 +155,30 @@ async def main() -> bool:
             await client.close()
         return False
 
-    if config.universal.connect_way == ConnectWay.WS_REVERSE:
+    if config.universal.connect_way == ConnectWay.MULTIPLE:
+        await run_multiple()
+    elif config.universal.connect_way == ConnectWay.WS_REVERSE:
         from .connect.ws_reverse import run
 
         logger.info("连接方式：反向 WebSocket")
         await run()
+    elif config.universal.connect_way == ConnectWay.UNIX:
+        from .connect.unix import run
+
+        logger.info("连接方式：Unix 套接字")
+        await run()
+    elif config.universal.connect_way == ConnectWay.WS:
+        logger.info("连接方式：正向 WebSocket")
+        if config.ws:
+            serve, _ = _http_server("onebot_cai.connect.ws:app", config.ws)
+            await serve
+    elif config.universal.connect_way == ConnectWay.HTTP:
+        logger.info("连接方式：HTTP")
+        if config.http:
+            serve, _ = _http_server("onebot_cai.connect.http:app", config.http)
+            await serve
     else:
-        if config.universal.connect_way == ConnectWay.WS:
-            if config.ws:
-                app = "onebot_cai.connect.ws:app"
-                host, port = config.ws.host, config.ws.port
-            else:
-                app = False
-                host = ""
-                port = 0
-            logger.info("连接方式：正向 WebSocket")
-        elif config.universal.connect_way == ConnectWay.HTTP:
-            if config.http:
-                app = "onebot_cai.connect.http:app"
-                host, port = config.http.host, config.http.port
-                logger.info("连接方式：HTTP")
-            else:
-                app = False
-                host = ""
-                port = 0
-        else:
-            logger.error(f"未知连接方式：{config.universal.connect_way}")
-            app = False
-            host = ""
-            port = 0
-
-        if app:
-            from uvicorn import Config, Server
-
-            uvicorn_config = Config(
-                app=app, host=host, port=port, log_config=LOGGING_CONFIG
-            )
-            server = Server(config=uvicorn_config)
-            await server.serve()
+        logger.error(f"未知连接方式：{config.universal.connect_way}")
 
     from .utils.database import database
 
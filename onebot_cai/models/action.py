@@ -31,6 +31,15 @@ class SendMessage(BaseModel):
     message: List[Dict[str, Any]]
 
 
+class SendMessageMulti(BaseModel):
+    """扩展：向多个目标发送消息"""
+
+    group_ids: List[int] = []
+    user_ids: List[int] = []
+    message: List[Dict[str, Any]]
+    concurrency: Optional[int] = None
+
+
 class MessageID(BaseModel):
     """消息 ID"""
 
@@ -44,9 +53,45 @@ class GetFile(BaseModel):
     type: Literal["url", "path", "data"]
 
 
+class PrepareMedia(BaseModel):
+    """扩展：预上传媒体"""
+
+    file_id: str
+    type: Literal["image", "voice", "audio", "video"]
+
+
 class BanGroupMember(BaseModel):
     """扩展：禁言群成员"""
 
     group_id: int
     user_id: int
     duration: Optional[int] = 600
+
+
+class MessageIDs(BaseModel):
+    """扩展：批量撤回消息"""
+
+    message_ids: List[str]
+    concurrency: Optional[int] = None
+
+
+class GroupMembers(BaseModel):
+    """扩展：批量设置群管理员"""
+
+    group_id: int
+    user_ids: List[int]
+    concurrency: Optional[int] = None
+
+
+class BanGroupMembers(GroupMembers):
+    """扩展：批量禁言群成员"""
+
+    duration: Optional[int] = 600
+
+
+class Batch(BaseModel):
+    """扩展：批量执行动作"""
+
+    requests: List[Dict[str, Any]]
+    sequential: bool = False
+    concurrency: Optional[int] = None
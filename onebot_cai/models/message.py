@@ -1,6 +1,6 @@
 from typing import List, Union, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from .others import FileID
 
@@ -12,6 +12,8 @@ class MessageSegment(BaseModel):
 
     type: str
     data: Optional[Union[dict, list]] = None
+    _parsed: Optional["MessageSegment"] = PrivateAttr(None)
+    """按 type 解析后的消息段，见 `msg.message.message_segment_to_sub_segment`"""
 
 
 Message = List[MessageSegment]
@@ -117,6 +119,23 @@ class AudioSegment(MessageSegment):
     data: FileID
 
 
+class Media(BaseModel):
+    """预上传的媒体"""
+
+    handle: str
+
+
+class MediaSegment(MessageSegment):
+    """
+    扩展消息段：预上传的媒体
+
+    handle 由 qq.prepare_media 动作返回的媒体句柄
+    """
+
+    type: str = "qq.media"
+    data: Media
+
+
 class Text(BaseModel):
     """文本"""
 
@@ -1,9 +1,22 @@
 """OneBot CAI 消息模块"""
-from uuid import UUID
+from time import time
 from io import BytesIO
 from inspect import isclass
-from typing import Dict, List, Union, Optional, Sequence
+from uuid import UUID, uuid4
+from typing import (
+    Any,
+    Dict,
+    List,
+    Type,
+    Tuple,
+    Union,
+    Callable,
+    Optional,
+    Sequence,
+    Awaitable,
+)
 
+from cai.api.client import Client
 from aiofiles import open as aio_open
 from pydantic.error_wrappers import ValidationError
 from httpx import AsyncClient, ConnectError, HTTPStatusError
@@ -20,14 +33,19 @@ from cai.client.message_service.models import (
 )
 
 from ..log import logger
+from ..config import config
 from ..models import message
-from ..models.others import File
+from ..utils.cache import TTLCache
+from ..models.others import File, FileID
 from ..exception import SegmentParseError
 from ..utils.runtime import seq_to_database_id
 from ..connect.exception import HTTPClientError
 from ..utils.media import video_to_mp4, audio_to_silk
 from ..models.message import (
+    ID,
     POKE_NAME,
+    Text,
+    Mention,
     Message,
     FaceSegment,
     ForwardNode,
@@ -35,6 +53,7 @@ from ..models.message import (
     TextSegment,
     AudioSegment,
     ImageSegment,
+    MediaSegment,
     ReplySegment,
     VideoSegment,
     VoiceSegment,
@@ -43,6 +62,13 @@ from ..models.message import (
     MentionAllSegment,
 )
 
+MEDIA_TTL = (config.universal.media_ttl or 86400000) / 1000
+"""媒体句柄有效期（秒）"""
+media_store: TTLCache[Element] = TTLCache(
+    config.universal.media_store_size or 1024, "media"
+)
+"""预上传媒体的 CAI Element，键为媒体句柄"""
+
 message_type = {}
 
 for item in vars(message).values():
@@ -51,12 +77,49 @@ for item in vars(message).values():
         message_type[type_] = item
 
 
+def _parse_text(data: Any) -> Optional[message.MessageSegment]:
+    if type(data) is dict and type(text := data.get("text")) is str:
+        return TextSegment.construct(data=Text.construct(text=text))
+
+
+def _parse_mention(data: Any) -> Optional[message.MessageSegment]:
+    if type(data) is dict and type(user_id := data.get("user_id")) is str:
+        return MentionSegment.construct(
+            data=Mention.construct(user_id=user_id)
+        )
+
+
+def _parse_mention_all(data: Any) -> Optional[message.MessageSegment]:
+    if data is None or type(data) is dict:
+        return MentionAllSegment.construct(data=data)
+
+
+def _parse_face(data: Any) -> Optional[message.MessageSegment]:
+    if type(data) is dict and type(id_ := data.get("id")) is int:
+        return FaceSegment.construct(data=ID.construct(id=id_))
+
+
+fast_segment_parsers: Dict[
+    str, Callable[[Any], Optional[message.MessageSegment]]
+] = {
+    "text": _parse_text,
+    "mention": _parse_mention,
+    "mention_all": _parse_mention_all,
+    "qq.face": _parse_face,
+}
+"""常用消息段的快速解析函数，数据类型均已正确时直接构造，否则返回 None 交由 pydantic 解析"""
+
+
 def dict_to_message(
     raw: Dict[str, Union[str, dict]]
 ) -> Optional[message.MessageSegment]:
     type_ = raw.get("type")
     if not type_:
         raise ValueError("There is no `type` in the message segment")
+    if (parser := fast_segment_parsers.get(type_)) and (  # type: ignore
+        segment := parser(raw.get("data"))
+    ):
+        return segment
     message_type_ = message_type.get(type_, message.MessageSegment)
     try:
         return message_type_.parse_obj(raw)
@@ -69,7 +132,18 @@ def dict_to_message(
 def message_segment_to_sub_segment(
     segment: message.MessageSegment,
 ) -> Optional[message.MessageSegment]:
-    return dict_to_message(segment.dict())
+    """
+    将通用消息段（如从数据库读取的消息）按 type 解析为具体的消息段
+
+    已是具体消息段时直接返回，否则只解析一次，结果缓存在消息段上
+    """
+    if type(segment) is not message.MessageSegment:
+        return segment
+    if segment._parsed is None:
+        segment._parsed = dict_to_message(
+            {"type": segment.type, "data": segment.data}  # type: ignore
+        )
+    return segment._parsed
 
 
 def get_message_element(
@@ -169,122 +243,197 @@ def get_message_element(
     return messages
 
 
+async def _reply_to_element(
+    segment: ReplySegment, client: Optional[Client], ignore_reply: bool
+) -> Optional[Element]:
+    from ..utils.database import database
+
+    if ignore_reply:
+        return None
+    if (
+        (msg := database.get_message(segment.data.message_id))
+        and (user_id := msg.user)
+        and (timestamp := msg.time)
+    ):
+        if message_ := await get_base_element(msg.msg, True):
+            return ReplyElement(
+                seq=msg.seq,
+                time=timestamp,
+                sender=user_id,
+                message=message_,
+                troop_name=None,
+            )
+    raise SegmentParseError(segment)
+
+
+async def _forward_to_element(
+    segment: ForwardSegment, client: Optional[Client], ignore_reply: bool
+) -> Optional[Element]:
+    nodes = []
+    for j in segment.data.nodes:
+        elements = await get_base_element(j.message)
+        if elements:
+            nodes.append(
+                CAIForwardNode(
+                    j.user_id,
+                    j.nickname,
+                    j.time,
+                    elements,
+                )
+            )
+        else:
+            logger.warning("未成功解析转发消息")
+    if client:
+        return await client.upload_forward_msg(segment.data.group_id, nodes)
+
+
+async def _poke_to_element(
+    segment: PokeSegment, client: Optional[Client], ignore_reply: bool
+) -> Optional[Element]:
+    id_ = segment.data.id
+    if 0 <= id_ <= 6:
+        return PokeElement(id=id_)
+    raise SegmentParseError(segment)
+
+
+async def _image_to_element(
+    segment: ImageSegment, client: Optional[Client], ignore_reply: bool
+) -> Optional[Element]:
+    if (bio := await get_binary(segment)) and client:
+        return await client.upload_image(0, BytesIO(bio))
+    raise SegmentParseError(segment)
+
+
+async def _voice_to_element(
+    segment: Union[VoiceSegment, AudioSegment],
+    client: Optional[Client],
+    ignore_reply: bool,
+) -> Optional[Element]:
+    if bio := await get_binary(segment):
+        silk_data = await audio_to_silk(bio)
+        if client:
+            return await client.upload_voice(0, BytesIO(silk_data))
+    raise SegmentParseError(segment)
+
+
+async def _video_to_element(
+    segment: VideoSegment, client: Optional[Client], ignore_reply: bool
+) -> Optional[Element]:
+    if bio := await get_binary(segment):
+        mp4, img = await video_to_mp4(bio)
+        if client:
+            return await client.upload_video(0, BytesIO(mp4), BytesIO(img))
+    raise SegmentParseError(segment)
+
+
+simple_element_converters: Dict[Type[Any], Callable[[Any], Element]] = {
+    TextSegment: lambda segment: TextElement(content=segment.data.text),
+    FaceSegment: lambda segment: FaceElement(id=segment.data.id),
+    MentionSegment: lambda segment: AtElement(
+        target=int(segment.data.user_id), display=segment.data.user_id
+    ),
+    MentionAllSegment: lambda _: AtAllElement(),
+}
+"""
+纯文本、表情、提及和提及所有人消息段到 CAI Element 的转换函数
+
+这些消息段无需网络、数据库和 CAI 客户端，可同步转换
+"""
+
+
+def get_simple_element(messages: Message) -> Optional[List[Element]]:
+    """
+    消息仅含纯文本、表情、提及和提及所有人消息段时直接转换为 CAI Element，
+    否则返回 None
+    """
+    converters = [simple_element_converters.get(type(i)) for i in messages]
+    if not all(converters):
+        return None
+    return [
+        converter(i) for converter, i in zip(converters, messages)  # type: ignore
+    ]
+
+
+async def _media_to_element(
+    segment: MediaSegment, client: Optional[Client], ignore_reply: bool
+) -> Optional[Element]:
+    if element := media_store.get(segment.data.handle):
+        return element
+    logger.warning(f"媒体句柄 {segment.data.handle} 不存在或已过期")
+    raise SegmentParseError(segment)
+
+
+element_converters: Dict[
+    str,
+    Callable[
+        [Any, Optional[Client], bool],
+        Awaitable[Optional[Element]],
+    ],
+] = {
+    "reply": _reply_to_element,
+    "qq.forward": _forward_to_element,
+    "qq.poke": _poke_to_element,
+    "image": _image_to_element,
+    "voice": _voice_to_element,
+    "audio": _voice_to_element,
+    "video": _video_to_element,
+    "qq.media": _media_to_element,
+}
+"""消息段类型到 CAI Element 转换函数的映射，消息段已经过校验，转换时不再校验"""
+
+
 async def get_base_element(
     messages: Message, ignore_reply: Optional[bool] = False
-) -> Optional[List[Element]]:  # sourcery skip: low-code-quality
+) -> Optional[List[Element]]:
     """OneBot 消息段 转 CAI Element"""
     from ..run import get_client
-    from ..utils.database import database
 
+    if (elements := get_simple_element(messages)) is not None:
+        return elements or None
     messages_ = []
     client = get_client()
-    # TODO log and type hint
     for i in messages:
         try:
-            if isinstance(i, message.MessageSegment):
-                try:
-                    i = message_segment_to_sub_segment(i)
-                except ValueError:
-                    logger.warning("解析消息段失败，可能是格式不符合")
-                    continue
-            if isinstance(i, ReplySegment) and not ignore_reply:
-                if (
-                    (msg := database.get_message(i.data.message_id))
-                    and (user_id := msg.user)
-                    and (timestamp := msg.time)
-                ):
-                    message_ = await get_base_element(msg.msg, True)
-                    if message_:
-                        messages_.append(
-                            ReplyElement(
-                                seq=msg.seq,
-                                time=timestamp,
-                                sender=user_id,
-                                message=message_,
-                                troop_name=None,
-                            )
-                        )
-                        continue
-                raise SegmentParseError(i)
-            elif isinstance(i, ForwardSegment):
-                nodes = []
-                for j in i.data.nodes:
-                    elements = await get_base_element(j.message)
-                    if elements:
-                        nodes.append(
-                            CAIForwardNode(
-                                j.user_id,
-                                j.nickname,
-                                j.time,
-                                elements,
-                            )
-                        )
-                    else:
-                        logger.warning("未成功解析转发消息")
-                if client:
-                    messages_.append(
-                        await client.upload_forward_msg(i.data.group_id, nodes)
-                    )
-                    continue
-            elif isinstance(i, TextSegment):
-                data = i.data
-                messages_.append(TextElement(content=data.text))
-                continue
-            elif isinstance(i, PokeSegment):
-                data = i.data
-                id_ = data.id
-                if 0 <= id_ <= 6:
-                    messages_.append(PokeElement(id=id_))
-                    continue
-                raise SegmentParseError(i)
-            elif isinstance(i, FaceSegment):
-                data = i.data
-                id_ = data.id
-                messages_.append(FaceElement(id=id_))
-                continue
-            elif isinstance(i, MentionSegment):
-                data = i.data
-                user_id = data.user_id
-                messages_.append(
-                    AtElement(target=int(user_id), display=user_id)
-                )
-                continue
-            elif isinstance(i, MentionAllSegment):
-                messages_.append(AtAllElement())
-            elif isinstance(i, ImageSegment):
-                if bio := await get_binary(i):
-                    if client:
-                        messages_.append(
-                            await client.upload_image(0, BytesIO(bio))
-                        )
-                        continue
-                raise SegmentParseError(i)
-            elif isinstance(i, (VoiceSegment, AudioSegment)):
-                if bio := await get_binary(i):
-                    silk_data = await audio_to_silk(bio)
-                    if client:
-                        messages_.append(
-                            await client.upload_voice(0, BytesIO(silk_data))
-                        )
-                        continue
-                raise SegmentParseError(i)
-            elif isinstance(i, VideoSegment):
-                if bio := await get_binary(i):
-                    mp4, img = await video_to_mp4(bio)
-                    if client:
-                        messages_.append(
-                            await client.upload_video(
-                                0, BytesIO(mp4), BytesIO(img)
-                            )
-                        )
-                        continue
-                raise SegmentParseError(i)
+            i = message_segment_to_sub_segment(i)
+        except ValueError:
+            logger.warning("解析消息段失败，可能是格式不符合")
+            continue
+        if not i:
+            continue
+        if simple_converter := simple_element_converters.get(type(i)):
+            messages_.append(simple_converter(i))
+            continue
+        if not (converter := element_converters.get(i.type)):
+            continue
+        try:
+            if element := await converter(i, client, bool(ignore_reply)):
+                messages_.append(element)
         except SegmentParseError as e:
             logger.warning(f"解析消息段 {e.name} 失败：可能是类型错误或缺少参数")
     if messages_:
         return messages_
 
 
+async def prepare_media(
+    type_: str, file_id: str, client: Optional[Client]
+) -> Tuple[str, int]:
+    """
+    下载、转码并上传媒体，保存得到的 CAI Element
+
+    type_ 消息段类型：image、voice、audio 或 video
+
+    返回：
+        （媒体句柄，过期时间戳）
+    """
+    segment = message_type[type_].construct(data=FileID(file_id=file_id))
+    element = await element_converters[type_](segment, client, False)
+    if element is None:
+        raise SegmentParseError(segment)
+    handle = str(uuid4())
+    media_store.set(handle, element, MEDIA_TTL)
+    return handle, int(time() + MEDIA_TTL)
+
+
 segment_alt_messages = {
     "ImageSegment": "[图片]",
     "VoiceSegment": "[语音]",
@@ -292,13 +441,18 @@ segment_alt_messages = {
     "MentionAllSegment": "@全体成员",
     "VideoSegment": "[视频]",
     "FaceSegment": "[表情]",
+    "MediaSegment": "[媒体]",
 }
 
 
 async def get_alt_message(
     message: Message, *, group_id: Optional[int] = None
 ) -> str:
-    """OneBot 消息段 转 纯文本替代"""
+    """
+    OneBot 消息段 转 纯文本替代
+
+    group_id 群号，提供时将提及转为群成员昵称（需获取群成员列表）
+    """
     from ..run import get_group_member_info
 
     msg = ""
@@ -1,32 +1,106 @@
 """OneBot CAI 通用运行模块"""
-import contextlib
+import asyncio
+import inspect
 from time import time
 from random import randint
-from typing import List, Tuple, Union, Optional
+from typing import (
+    Any,
+    Dict,
+    List,
+    Type,
+    Tuple,
+    Union,
+    Callable,
+    Optional,
+    Awaitable,
+    NamedTuple,
+)
 
 from cai.api.client import Client
-from pydantic import ValidationError
+from cai.client.events.base import Event
+from pydantic import BaseModel, ValidationError
 from cai.client.status_service import OnlineStatus
+from cai.client.message_service.models import Element
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from cai.client.events.common import BotOnlineEvent, BotOfflineEvent
 from cai.api.error import (
     BotException,
     BotMutedException,
     AtAllLimitException,
     GroupMsgLimitException,
 )
+from cai.client.events.group import (
+    GroupMemberLeaveEvent,
+    GroupMemberJoinedEvent,
+    GroupMemberPermissionChangeEvent,
+    GroupMemberSpecialTitleChangedEvent,
+)
 
 from .log import logger
 from .login import login
 from .config import config
 from .const import Protocol
+from .utils.cache import TTLCache
+from .utils.metrics import metrics
 from .exception import ParamNotFound
 from .utils.database import database
 from .msg.message import get_base_element
+from .utils.breaker import CircuitBreaker
+from .utils.singleflight import single_flight
+from .utils.validator import compile_validator
 from .models.message import Message, DatabaseMessage
 from .connect.status import STATUS, OKInfo, FailedInfo, SuccessRequest
 from .models.others import GroupInfo, FriendInfo, StatusInfo, GroupMemberInfo
 
 client: Optional[Client] = None
+breaker = CircuitBreaker(
+    5
+    if config.action.breaker_threshold is None
+    else config.action.breaker_threshold,
+    config.action.breaker_reset_interval or 30000,
+)
+"""QQ 会话熔断器"""
+BREAKER_EXEMPT_ACTIONS = {"get_status"}
+"""不受熔断器限制的动作"""
+SESSION_EXCEPTIONS = (BotException, ConnectionError)
+"""视为会话异常的 CAI 异常"""
+NO_CACHE_PARAM = "no_cache"
+"""跳过响应缓存的参数名，为 true 时重新获取并更新缓存"""
+DEFAULT_CACHE_TTLS = {
+    "get_version": 3600000,
+    "get_self_info": 60000,
+    "get_user_info": 60000,
+    "get_friend_list": 60000,
+    "get_group_info": 60000,
+    "get_group_list": 60000,
+    "get_group_member_info": 60000,
+    "get_group_member_list": 60000,
+}
+"""只读动作的默认响应缓存时间（毫秒）"""
+CACHE_SIZE = (
+    1024 if config.action.cache_size is None else config.action.cache_size
+)
+CACHE_TTLS = (
+    {**DEFAULT_CACHE_TTLS, **config.action.cache_ttls} if CACHE_SIZE else {}
+)
+response_cache: TTLCache[SuccessRequest] = TTLCache(CACHE_SIZE, "response")
+"""只读动作的响应缓存，键为（动作名，校验后的参数）"""
+GROUP_CACHE_EVENTS = (
+    GroupMemberLeaveEvent,
+    GroupMemberJoinedEvent,
+    GroupMemberPermissionChangeEvent,
+    GroupMemberSpecialTitleChangedEvent,
+)
+"""使对应群的响应缓存失效的事件"""
+IDEMPOTENCY_PARAM = "qq.idempotency_key"
+"""幂等键参数名"""
+IDEMPOTENT_ACTIONS = {"send_message", "qq.send_message_multi"}
+"""支持幂等键的动作"""
+IDEMPOTENCY_TTL = (config.action.idempotency_ttl or 600000) / 1000
+idempotency_store: TTLCache[asyncio.Task] = TTLCache(
+    config.action.idempotency_size or 10000, "idempotency"
+)
+"""幂等键存储，键为（动作名，幂等键），值为执行动作的任务"""
 
 
 async def init(account: int, password: str) -> bool:
@@ -42,9 +116,30 @@ async def init(account: int, password: str) -> bool:
     if not status:
         return False
         # await close(None, True)
+    client.add_event_listener(handle_session_event)
+    client.add_event_listener(handle_cache_event)
     return True
 
 
+async def handle_session_event(_client: Client, event: Event):
+    """根据上线、下线事件开关熔断器"""
+    if isinstance(event, BotOfflineEvent):
+        breaker.trip(34099, "机器人已下线")
+    elif isinstance(event, BotOnlineEvent):
+        breaker.reset()
+
+
+async def handle_cache_event(_client: Client, event: Event):
+    """群成员变动时使相关的响应缓存失效，上线时清空响应缓存"""
+    if isinstance(event, BotOnlineEvent):
+        response_cache.clear()
+    elif isinstance(event, GROUP_CACHE_EVENTS):
+        item = ("group_id", event.group_id)
+        response_cache.invalidate(
+            lambda key: key[0] == "get_group_list" or item in key[1]
+        )
+
+
 def get_status(_client: Client) -> StatusInfo:
     """获取运行状态"""
     if status := _client.status:
@@ -76,6 +171,7 @@ async def get_group_member_info(
     return next((i for i in member_list if i.user_id == user_id), None)
 
 
+@single_flight
 async def get_group_member_info_list(
     group_id: int, no_cache: bool = True
 ) -> List[GroupMemberInfo]:
@@ -98,6 +194,7 @@ async def get_group_member_info_list(
     return onebot_member_list
 
 
+@single_flight
 async def get_group_info(
     group_id: int, no_cache: bool = True
 ) -> Optional[GroupInfo]:
@@ -111,6 +208,7 @@ async def get_group_info(
             )
 
 
+@single_flight
 async def get_group_info_list() -> List[GroupInfo]:
     """获取群信息列表"""
     if client:
@@ -125,6 +223,7 @@ async def get_group_info_list() -> List[GroupInfo]:
     return []
 
 
+@single_flight
 async def get_friend_info_list(no_cache: bool = True) -> List[FriendInfo]:
     """获取好友信息列表"""
     if client:
@@ -176,11 +275,19 @@ async def delete_group_msg(
 
 
 async def send_group_msg(
-    _client: Client, group_id: int, msg: Message
+    _client: Client,
+    group_id: int,
+    msg: Message,
+    element: Optional[List[Element]] = None,
 ) -> Union[int, Tuple[int, int, int]]:
-    """发送群消息"""
+    """
+    发送群消息
+
+    element 已转换的 CAI Element，向多个目标发送同一消息时只需转换一次
+    """
     try:
-        element = await get_base_element(msg)
+        if element is None:
+            element = await get_base_element(msg)
         if element:
             seq, rand, timestamp = await _client.send_group_msg(
                 group_id, element
@@ -219,11 +326,19 @@ async def delete_private_msg(
 
 
 async def send_private_msg(
-    _client: Client, user_id: int, msg: Message
+    _client: Client,
+    user_id: int,
+    msg: Message,
+    element: Optional[List[Element]] = None,
 ) -> Union[int, Tuple[int, int, int]]:
-    """发送好友消息"""
+    """
+    发送好友消息
+
+    element 已转换的 CAI Element，向多个目标发送同一消息时只需转换一次
+    """
     try:
-        element = await get_base_element(msg)
+        if element is None:
+            element = await get_base_element(msg)
         if element:
             seq, rand, timestamp = await _client.send_friend_msg(
                 user_id, element
@@ -245,66 +360,348 @@ async def send_private_msg(
         raise
 
 
+class ActionInfo(NamedTuple):
+    """动作描述"""
+
+    func: Callable[..., Awaitable[SuccessRequest]]
+    """动作函数"""
+    need_client: bool
+    """是否需要传入 CAI 客户端"""
+    model: Optional[Type[BaseModel]]
+    """参数模型，为 None 时直接传入参数"""
+    model_param: Optional[str]
+    """参数模型对应的函数参数名"""
+    validate: Optional[Callable[[Dict[str, Any]], BaseModel]]
+    """参数模型的预编译校验函数"""
+
+
+def collect_actions(namespace: Dict[str, Any]) -> Dict[str, ActionInfo]:
+    """
+    收集动作，由动作模块导入时调用一次
+
+    namespace 动作模块的 globals()
+
+    返回：
+        Dict(OneBot 动作名，动作描述)，扩展动作 qq_xxx 的动作名为 qq.xxx
+    """
+    actions = {}
+    for name, func in namespace.items():
+        if (
+            name.startswith("_")  # 排除私有函数和魔法方法
+            or name.lower() != name  # 排除类
+            or not inspect.iscoroutinefunction(func)
+            or "echo" not in func.__annotations__  # 是否为动作
+        ):
+            continue
+        annotations = func.__annotations__
+        model_param = next(
+            (
+                param
+                for param, annotation in annotations.items()
+                if inspect.isclass(annotation)
+                and issubclass(annotation, BaseModel)
+            ),
+            None,
+        )
+        if name.startswith("qq_"):  # 扩展动作
+            name = name.replace("qq_", "qq.", 1)
+        model = annotations[model_param] if model_param else None
+        actions[name] = ActionInfo(
+            func=func,
+            need_client="client" in annotations,
+            model=model,
+            model_param=model_param,
+            validate=compile_validator(model) if model else None,
+        )
+    return actions
+
+
+_actions: Dict[str, ActionInfo] = {}
+_supported_actions: List[str] = []
+
+
+def get_actions() -> Dict[str, ActionInfo]:
+    """获取动作注册表"""
+    global _actions, _supported_actions
+
+    if not _actions:
+        from .action import ACTIONS
+
+        _actions = ACTIONS
+        _supported_actions = ["get_supported_actions", *ACTIONS]
+    return _actions
+
+
+def resolve_action(action: str) -> Tuple[str, Optional[ActionInfo]]:
+    """
+    查找动作，兼容 qq_xxx 动作名
+
+    返回：
+        （OneBot 动作名，动作描述），动作不存在时动作描述为 None
+    """
+    actions = get_actions()
+    info = actions.get(action)
+    if info is None and action.startswith("qq_"):
+        action = action.replace("qq_", "qq.", 1)
+        info = actions.get(action)
+    return action, info
+
+
 def get_supported_actions(echo: str):
     """
     获取支持的动作列表
     https://12.onebot.dev/interface/meta/actions/#get_supported_actions
     """
-    import onebot_cai.action as action_module
-
-    actions = ["get_supported_actions"]
-    for name in dir(action_module):
-        if (
-            "__" not in name  # 排除魔法方法
-            and name != "get_latest_events"  # 排除获取最新事件列表
-            and name.lower() == name  # 排除类
-            and (func := getattr(action_module, name))
-            and callable(func)  # 排除不可调用对象
-        ):
-            with contextlib.suppress(AttributeError):
-                if "echo" in func.__annotations__:  # 是否为动作
-                    if "qq_" in name:  # 扩展动作
-                        name = name.replace("qq_", "qq.")
-                    actions.append(name)
+    get_actions()
     return OKInfo(
-        data=actions,
+        data=_supported_actions,
         echo=echo,
     )
 
 
-async def run_action(action: str, **kwargs) -> SuccessRequest:
-    """执行动作"""
-    from . import action as action_module
+TIMEOUT_PARAM = "qq.timeout"
+"""动作超时时间参数名（毫秒）"""
+DEFAULT_TIMEOUT = (
+    60000 if config.action.timeout is None else config.action.timeout
+)
 
-    echo = kwargs.pop("echo", "")
+
+DEFAULT_TIMEOUTS = {"qq.send_message_multi": 0}
+"""各动作的默认超时时间（毫秒），批量发送受速率限制，执行时间与目标数成正比"""
+
+
+def get_timeout(
+    action: str, requested: Optional[int] = None
+) -> Optional[float]:
+    """
+    获取动作超时时间（秒），None 表示不超时
+
+    action 动作名
+    requested 请求中的超时时间（毫秒，正整数），只能缩短配置的超时时间
+    """
+    timeout = config.action.timeouts.get(
+        action, DEFAULT_TIMEOUTS.get(action, DEFAULT_TIMEOUT)
+    )
+    if requested:
+        timeout = min(timeout, requested) if timeout else requested
+    return timeout / 1000 if timeout else None
+
+
+async def run_with_timeout(
+    action: str,
+    echo: str,
+    coro: Awaitable[SuccessRequest],
+    timeout: Optional[float],
+) -> SuccessRequest:
+    """执行动作，超时时取消动作，正在进行的 CAI 请求和 FFmpeg 进程随之结束"""
     try:
-        action = action.replace(".", "_")
-        if action.startswith("_"):
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"动作 {action} 执行超时（{timeout} 秒）")
+        metrics.inc("action_timeouts", action=action)
+        return FailedInfo(
+            retcode=32000,
+            echo=echo,
+            message=STATUS[32000],
+            data={"timeout": int(timeout * 1000)},  # type: ignore
+        )
+
+
+def get_cache_key(
+    action: str, info: ActionInfo, kwargs: Dict[str, Any]
+) -> Optional[Tuple[str, Tuple[Tuple[str, Any], ...]]]:
+    """
+    获取响应缓存的键，参数无法作为键时返回 None
+
+    kwargs 校验后的参数，无参数模型的动作不使用参数
+    """
+    if not info.model_param:
+        return action, ()
+    key = (action, tuple(sorted(kwargs[info.model_param].__dict__.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def get_session_retcode(resp: SuccessRequest) -> int:
+    """
+    获取用于熔断器的返回码
+
+    批量动作成功时 data 为各项响应的列表：有一项成功即视为会话正常，
+    否则有一项无法发送消息（34000）即视为会话异常
+    """
+    if (
+        resp.retcode == 0
+        and isinstance(resp.data, list)
+        and resp.data
+        and all(isinstance(i, SuccessRequest) for i in resp.data)
+    ):
+        retcodes = {i.retcode for i in resp.data}  # type: ignore
+        if 0 in retcodes:
+            return 0
+        return 34000 if 34000 in retcodes else min(retcodes)
+    return resp.retcode
+
+
+async def execute_action(
+    action: str,
+    info: ActionInfo,
+    echo: str,
+    kwargs: Dict[str, Any],
+    timeout: Optional[float],
+    session_timeout: bool = True,
+) -> SuccessRequest:
+    """
+    执行已校验参数的动作，经过熔断器并限制执行时间
+
+    session_timeout 超时是否视为会话异常，应用端缩短了超时时间时为 False
+    """
+    args = []
+    if info.need_client:
+        if not (client := get_client()):
             return FailedInfo(
-                retcode=10002, echo=echo, message=STATUS[10002], data=None
+                retcode=34099, echo=echo, message=STATUS[34099], data=None
+            )
+        args.append(client)
+    # 熔断器打开时在准备消息、下载和转码媒体前直接失败
+    gated = info.need_client and action not in BREAKER_EXEMPT_ACTIONS
+    if gated:
+        retcode, token = breaker.allow()
+        if retcode is not None:
+            return FailedInfo(
+                retcode=retcode, echo=echo, message=STATUS[retcode], data=None
             )
+    try:
+        resp = await run_with_timeout(
+            action, echo, info.func(*args, echo, **kwargs), timeout
+        )
+    except SESSION_EXCEPTIONS:
+        if gated:
+            breaker.record_failure(token)
+        raise
+    except BaseException:
+        # 参数错误、处理函数错误与取消等与会话状态无关，不应由单个应用端打开熔断器
+        if gated:
+            breaker.release(token)
+        raise
+    if gated:
+        retcode = get_session_retcode(resp)
+        if retcode == 32000 and not session_timeout:
+            breaker.release(token)
+        else:
+            breaker.record(retcode, token)
+    return resp
+
+
+async def run_idempotent(
+    action: str,
+    key: str,
+    echo: str,
+    run: Callable[[], Awaitable[SuccessRequest]],
+) -> SuccessRequest:
+    """
+    按幂等键执行动作
+
+    相同动作与幂等键的请求在执行中时等待原请求，成功后在有效期内直接返回原结果；
+    原请求失败时移除幂等键，重试将重新执行。
+    原请求的调用方被取消（如连接断开）时动作仍会执行完成，以便重试得到结果
+    """
+    store_key = (action, key)
+    if (task := idempotency_store.get(store_key)) is None:
+        task = asyncio.create_task(run())
+        idempotency_store.set(store_key, task, IDEMPOTENCY_TTL)
+
+        def done(_):
+            if (
+                task.cancelled()
+                or task.exception()
+                or task.result().retcode != 0
+            ):
+                idempotency_store.pop(store_key, task)
+
+        task.add_done_callback(done)
+    else:
+        logger.debug(f"动作 {action} 的幂等键 {key} 已存在，返回原请求的结果")
+        metrics.inc("idempotent_replays", action=action)
+    resp = await asyncio.shield(task)
+    if resp.echo == echo:
+        return resp
+    data = resp.data
+    if isinstance(data, list):
+        # 批量动作各项的 echo 与原请求相同，一并替换
+        data = [
+            i.copy(update={"echo": echo})
+            if isinstance(i, SuccessRequest) and i.echo == resp.echo
+            else i
+            for i in data
+        ]
+    return resp.copy(update={"echo": echo, "data": data})
+
+
+async def run_action(action: str, **kwargs) -> SuccessRequest:
+    """执行动作"""
+    echo = kwargs.pop("echo", "")
+    try:
         if action == "get_supported_actions":
             return get_supported_actions(echo)
-        func = getattr(action_module, action, None)
-        if not callable(func):
+        action, info = resolve_action(action)
+        if info is None:
             return FailedInfo(
                 retcode=10002, echo=echo, message=STATUS[10002], data=None
             )
-        need_params = func.__annotations__.keys()
         try:
-            if len(need_params) == 1 or "client" not in need_params:
-                return await func(echo, **kwargs)
-            client = get_client()
-            return (
-                await func(client, echo, **kwargs)
-                if client
-                else FailedInfo(
-                    retcode=34099,
+            requested_timeout = kwargs.pop(TIMEOUT_PARAM, None)
+            no_cache = kwargs.pop(NO_CACHE_PARAM, False) is True
+            idempotency_key = kwargs.pop(IDEMPOTENCY_PARAM, None)
+            reason = None
+            if requested_timeout is not None and (
+                type(requested_timeout) is not int or requested_timeout <= 0
+            ):
+                reason = f"{TIMEOUT_PARAM} must be a positive integer"
+            elif idempotency_key is None:
+                pass
+            elif type(idempotency_key) is not str:
+                reason = f"{IDEMPOTENCY_PARAM} must be a string"
+            elif action not in IDEMPOTENT_ACTIONS:
+                reason = f"{IDEMPOTENCY_PARAM} is not supported by {action}"
+            if reason:
+                return FailedInfo(
+                    retcode=10003,
                     echo=echo,
-                    message=STATUS[34099],
-                    data=None,
+                    message=STATUS[10003],
+                    data={"reason": reason},
                 )
-            )
+            timeout = get_timeout(action, requested_timeout)
+            session_timeout = timeout == get_timeout(action)
+            if info.validate:
+                kwargs = {info.model_param: info.validate(kwargs)}
+            cache_key = None
+            if (ttl := CACHE_TTLS.get(action)) and (
+                cache_key := get_cache_key(action, info, kwargs)
+            ):
+                if not no_cache and (cached := response_cache.get(cache_key)):
+                    metrics.inc("cache_hits", cache="response", action=action)
+                    return cached.copy(update={"echo": echo})
+                metrics.inc("cache_misses", cache="response", action=action)
+                generation = response_cache.generation
+            if idempotency_key and action in IDEMPOTENT_ACTIONS:
+                resp = await run_idempotent(
+                    action,
+                    idempotency_key,
+                    echo,
+                    lambda: execute_action(
+                        action, info, echo, kwargs, timeout, session_timeout
+                    ),
+                )
+            else:
+                resp = await execute_action(
+                    action, info, echo, kwargs, timeout, session_timeout
+                )
+            if cache_key and resp.retcode == 0:
+                response_cache.set(cache_key, resp, ttl / 1000, generation)
+            return resp
         except (ValidationError, ParamNotFound) as e:
             return FailedInfo(
                 retcode=10003,
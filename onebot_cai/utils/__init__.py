@@ -1,5 +1,5 @@
 """OneBot CAI 通用模块"""
-__all__ = ["database", "media"]
+__all__ = ["database", "media", "metrics"]
 from .media import (
     pcm_to_silk,
     silk_to_pcm,
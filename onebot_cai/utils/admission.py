@@ -0,0 +1,146 @@
+"""
+OneBot CAI 动作准入控制模块
+
+限制全局与每个客户端同时执行的动作数。超出限制的请求进入该客户端的有界等待队列，
+空出名额时在有等待请求的客户端之间轮流放行，队列已满时立即拒绝，
+避免单个应用端大量并发请求导致其他应用端的动作迟迟得不到执行。
+qq.batch 等会同时执行多个动作的请求可按权重占用多个名额。
+"""
+import asyncio
+from collections import deque
+from time import perf_counter
+from typing import Dict, Deque, Tuple, Optional
+
+from ..log import logger
+from .metrics import metrics
+
+
+class AdmissionController:
+    """准入控制器"""
+
+    def __init__(self, limit: int, client_limit: int, queue_size: int):
+        """
+        limit 全局同时执行的最大动作数，0 表示不限
+        client_limit 每个客户端同时执行的最大动作数，0 表示不限
+        queue_size 每个客户端等待队列的最大长度，0 表示超出限制时立即拒绝
+        """
+        self.limit = limit
+        self.client_limit = client_limit
+        self.queue_size = queue_size
+        self.running = 0
+        """执行中的动作数"""
+        self.queued = 0
+        """等待中的动作数"""
+        self._running: Dict[str, int] = {}
+        self._waiters: Dict[str, Deque[Tuple[asyncio.Future, int]]] = {}
+        """各客户端的等待队列（Future，权重），按放行顺序排列，放行后移至末尾"""
+
+    def _update_metrics(self):
+        metrics.set("action_running", self.running)
+        metrics.set("action_queued", self.queued)
+
+    def _clamp(self, weight: int) -> int:
+        """将权重限制在上限内，保证请求最终能够执行"""
+        for limit in (self.limit, self.client_limit):
+            if limit:
+                weight = min(weight, limit)
+        return max(1, weight)
+
+    def _can_run(self, client: str, weight: int) -> bool:
+        return (not self.limit or self.running + weight <= self.limit) and (
+            not self.client_limit
+            or self._running.get(client, 0) + weight <= self.client_limit
+        )
+
+    def _start(self, client: str, weight: int):
+        self.running += weight
+        self._running[client] = self._running.get(client, 0) + weight
+
+    def _wake(self):
+        """在有等待请求的客户端之间轮流放行，直至没有可用名额"""
+        granted = True
+        while granted and self._waiters:
+            granted = False
+            for client in list(self._waiters):
+                if self.limit and self.running >= self.limit:
+                    return
+                waiters = self._waiters[client]
+                # 跳过已取消但尚未自行移出队列的等待方
+                while waiters and waiters[0][0].done():
+                    waiters.popleft()
+                    self.queued -= 1
+                if not waiters:
+                    del self._waiters[client]
+                    continue
+                if not self._can_run(client, waiters[0][1]):
+                    continue
+                del self._waiters[client]
+                future, weight = waiters.popleft()
+                self._start(client, weight)
+                self.queued -= 1
+                future.set_result(None)
+                if waiters:
+                    self._waiters[client] = waiters
+                granted = True
+
+    async def acquire(self, client: str, weight: int = 1) -> Optional[float]:
+        """
+        申请执行名额
+
+        client 客户端标识
+        weight 占用的名额数，超出上限时按上限计
+
+        返回：
+            排队等待的时间（秒），被拒绝时返回 None
+        """
+        weight = self._clamp(weight)
+        if client not in self._waiters and self._can_run(client, weight):
+            self._start(client, weight)
+            self._update_metrics()
+            return 0.0
+        waiters = self._waiters.get(client)
+        if len(waiters or ()) >= self.queue_size:
+            logger.debug(f"客户端 {client} 的动作请求过多，已拒绝")
+            metrics.inc("action_rejected", client=client)
+            return None
+        if waiters is None:
+            waiters = self._waiters[client] = deque()
+        future = asyncio.get_running_loop().create_future()
+        item = (future, weight)
+        waiters.append(item)
+        self.queued += 1
+        self._update_metrics()
+        start = perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                # 已获得名额但等待方被取消
+                self.release(client, weight)
+            elif item in waiters:  # 未被 _wake 跳过时自行移出队列
+                waiters.remove(item)
+                self.queued -= 1
+                if not waiters and self._waiters.get(client) is waiters:
+                    del self._waiters[client]
+                self._update_metrics()
+            raise
+        wait = perf_counter() - start
+        metrics.inc("action_queue_waits")
+        metrics.inc("action_queue_wait_seconds", wait)
+        self._update_metrics()
+        return wait
+
+    def release(self, client: str, weight: int = 1):
+        """
+        归还执行名额
+
+        weight 申请时的权重
+        """
+        weight = self._clamp(weight)
+        self.running -= weight
+        if self._running[client] > weight:
+            self._running[client] -= weight
+        else:
+            del self._running[client]
+        self._wake()
+        self._update_metrics()
@@ -0,0 +1,132 @@
+"""
+OneBot CAI 熔断器模块
+
+QQ 会话离线或被风控时，动作在消息转换、媒体下载、转码和上传之后才会失败。
+熔断器在连续失败达到阈值或收到下线事件后打开，直接拒绝需要 QQ 会话的动作；
+打开一段时间后进入半开状态，放行一个探测动作，成功则关闭，失败则重新打开。
+
+放行动作时返回令牌，记录结果时须传回。令牌为放行时的代数，状态每次改变及放行探测动作时
+代数加一，因此打开前放行的慢动作或非探测动作的结果不会改变熔断器状态。
+"""
+from enum import IntEnum
+from time import monotonic
+from typing import Tuple, Optional
+
+from ..log import logger
+from .metrics import metrics
+
+SESSION_ERRORS = frozenset({32000, 34000})
+"""视为会话异常的返回码：执行超时、无法发送消息"""
+
+
+class BreakerState(IntEnum):
+    """熔断器状态"""
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker:
+    """熔断器"""
+
+    def __init__(self, threshold: int, reset_interval: int):
+        """
+        threshold 打开熔断器的连续失败次数，0 表示只在下线时打开
+        reset_interval 打开后进入半开状态的时间（毫秒）
+        """
+        self.threshold = threshold
+        self.reset_interval = reset_interval / 1000
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        """连续失败次数"""
+        self.retcode = 34000
+        """打开时拒绝动作使用的返回码"""
+        self._opened_at = 0.0
+        self._probing = False
+        self.generation = 0
+        """代数，令牌与之相同时结果才会改变状态"""
+        self._set_state(BreakerState.CLOSED)
+
+    def _set_state(self, state: BreakerState):
+        self.state = state
+        self.generation += 1
+        metrics.set("breaker_state", int(state))
+
+    def allow(self) -> Tuple[Optional[int], int]:
+        """
+        是否允许执行动作
+
+        返回：
+            Tuple(允许则为 None，否则为拒绝使用的返回码，令牌)
+        """
+        if self.state == BreakerState.CLOSED:
+            return None, self.generation
+        if (
+            self.state == BreakerState.OPEN
+            and monotonic() - self._opened_at >= self.reset_interval
+        ):
+            logger.info("熔断器进入半开状态，放行一个探测动作")
+            self._set_state(BreakerState.HALF_OPEN)
+        if self.state == BreakerState.HALF_OPEN and not self._probing:
+            self._probing = True
+            self.generation += 1
+            return None, self.generation
+        metrics.inc("breaker_rejected", retcode=self.retcode)
+        return self.retcode, self.generation
+
+    def record(self, retcode: int, token: int):
+        """根据动作返回码记录结果，与会话无关的返回码只结束探测"""
+        if retcode == 0:
+            self.record_success(token)
+        elif retcode in SESSION_ERRORS:
+            self.record_failure(token)
+        else:
+            self.release(token)
+
+    def record_success(self, token: int):
+        """记录动作成功"""
+        if token != self.generation:
+            return
+        self.failures = 0
+        if self.state == BreakerState.HALF_OPEN:
+            self._probing = False
+            logger.info("探测动作成功，熔断器关闭")
+            self._set_state(BreakerState.CLOSED)
+
+    def record_failure(self, token: int):
+        """记录会话相关的失败"""
+        if token != self.generation:
+            return
+        self.failures += 1
+        if self.state == BreakerState.HALF_OPEN:
+            self._probing = False
+            self.trip(self.retcode, "探测动作失败")
+        elif self.threshold and self.failures >= self.threshold:
+            self.trip(34000, f"连续 {self.failures} 次动作失败")
+
+    def release(self, token: int):
+        """动作结果与会话状态无关，探测动作结束探测但不改变状态"""
+        if token == self.generation and self.state == BreakerState.HALF_OPEN:
+            self._probing = False
+
+    def trip(self, retcode: int, reason: str):
+        """
+        打开熔断器
+
+        retcode 拒绝动作使用的返回码
+        reason 原因
+        """
+        if self.state != BreakerState.OPEN:
+            logger.warning(f"熔断器打开：{reason}")
+        self.retcode = retcode
+        self._opened_at = monotonic()
+        self._set_state(BreakerState.OPEN)
+
+    def reset(self):
+        """关闭熔断器"""
+        self.failures = 0
+        self._probing = False
+        if self.state != BreakerState.CLOSED:
+            logger.info("熔断器关闭")
+            self._set_state(BreakerState.CLOSED)
@@ -0,0 +1,93 @@
+"""
+OneBot CAI 缓存模块
+
+带过期时间的 LRU 缓存，超出容量时淘汰最久未使用的条目。
+"""
+from time import monotonic
+from collections import OrderedDict
+from typing import Any, Tuple, Generic, TypeVar, Callable, Hashable, Optional
+
+from .metrics import metrics
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """带过期时间的 LRU 缓存"""
+
+    def __init__(self, maxsize: int, name: str):
+        """
+        maxsize 最大条目数
+        name 缓存名称，用于指标标签
+        """
+        self.maxsize = maxsize
+        self.name = name
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.generation = 0
+        """失效次数，用于丢弃失效前开始获取的结果"""
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """获取未过期的条目，不存在或已过期时返回 None"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires <= monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: V,
+        ttl: float,
+        generation: Optional[int] = None,
+    ):
+        """
+        设置条目
+
+        ttl 过期时间（秒）
+        generation 开始获取时的 generation，此后发生过失效则不设置
+        """
+        if generation is not None and generation != self.generation:
+            return
+        self._data[key] = (monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            metrics.inc("cache_evictions", cache=self.name)
+
+    def pop(self, key: Hashable, value: Optional[V] = None):
+        """
+        删除条目
+
+        value 不为 None 时仅在条目的值为 value 时删除
+        """
+        item = self._data.get(key)
+        if item is not None and (value is None or item[1] is value):
+            del self._data[key]
+
+    def invalidate(self, predicate: Callable[[Any], bool]) -> int:
+        """
+        删除键满足条件的条目
+
+        返回：
+            删除的条目数
+        """
+        self.generation += 1
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        if keys:
+            metrics.inc("cache_invalidations", len(keys), cache=self.name)
+        return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        self.generation += 1
+        self._data.clear()
@@ -2,27 +2,63 @@
 OneBot CAI 媒体转换模块
 本模块需要 FFmpeg！
 """
+import asyncio
 import tempfile
+import contextlib
 from io import BytesIO
 from asyncio import sleep
 from os import close, remove
 from typing import Tuple, Union
+from subprocess import PIPE, DEVNULL
 
 import ffmpeg
 import pysilk
 import aiofiles
 
 
-def audio_to_pcm(audio: str):
+async def run_ffmpeg(stream) -> None:
+    """
+    异步运行 FFmpeg，所在任务被取消时结束 FFmpeg 进程
+
+    stream ffmpeg-python 输出流
+    """
+    process = await asyncio.create_subprocess_exec(
+        *stream.compile(), stdin=DEVNULL, stdout=DEVNULL, stderr=PIPE
+    )
+    try:
+        _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        with contextlib.suppress(ProcessLookupError):
+            process.kill()
+        await process.wait()
+        raise
+    if process.returncode:
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+
+
+def _remove(*names: str):
+    for name in names:
+        with contextlib.suppress(FileNotFoundError):
+            remove(name)
+
+
+async def audio_to_pcm(audio: str):
     """
     音频转 PCM
 
     audio 音频文件路径
     """
     file, name = tempfile.mkstemp(suffix=".pcm")
-    ffmpeg.input(audio).output(
-        name, format="s16le", loglevel=16, ar=24000
-    ).overwrite_output().run()
+    try:
+        await run_ffmpeg(
+            ffmpeg.input(audio)
+            .output(name, format="s16le", loglevel=16, ar=24000)
+            .overwrite_output()
+        )
+    except BaseException:
+        close(file)
+        _remove(name)
+        raise
     return file, name
 
 
@@ -43,22 +79,28 @@ async def video_to_mp4(video: Union[bytes, BytesIO]) -> Tuple[bytes, bytes]:
         await f.write(video)
     mp4_file, mp4_name = tempfile.mkstemp(suffix=".mp4")
     img_file, img_name = tempfile.mkstemp(suffix=".jpg")
-    ffmpeg.input(f.name).output(
-        mp4_name, loglevel=16, c="copy", map=0
-    ).overwrite_output().run()
-    image_param = {"ss": 1, "loglevel": 16, "frames:v": 1}
-    await sleep(1)
-    ffmpeg.input(mp4_name).output(
-        img_name, **image_param
-    ).overwrite_output().run()
-    async with aiofiles.open(mp4_name, "rb") as mp4_io:
-        mp4_data = await mp4_io.read()
-    async with aiofiles.open(img_name, "rb") as img_io:
-        img_data = await img_io.read()
-    for i, j in zip((mp4_file, img_file), (mp4_name, img_name)):
-        close(i)
-        remove(j)
-    remove(f.name)
+    try:
+        await run_ffmpeg(
+            ffmpeg.input(f.name)
+            .output(mp4_name, loglevel=16, c="copy", map=0)
+            .overwrite_output()
+        )
+        image_param = {"ss": 1, "loglevel": 16, "frames:v": 1}
+        await sleep(1)
+        await run_ffmpeg(
+            ffmpeg.input(mp4_name)
+            .output(img_name, **image_param)
+            .overwrite_output()
+        )
+        async with aiofiles.open(mp4_name, "rb") as mp4_io:
+            mp4_data = await mp4_io.read()
+        async with aiofiles.open(img_name, "rb") as img_io:
+            img_data = await img_io.read()
+    finally:
+        # 任务被取消时也需清理临时文件
+        close(mp4_file)
+        close(img_file)
+        _remove(mp4_name, img_name, f.name)
     return mp4_data, img_data
 
 
@@ -88,8 +130,10 @@ async def audio_to_silk(audio: Union[BytesIO, bytes]) -> bytes:
         mode="wb", delete=False
     ) as f:
         await f.write(audio)
-    file, name = audio_to_pcm(f.name)
-    remove(f.name)
+    try:
+        file, name = await audio_to_pcm(f.name)
+    finally:
+        _remove(f.name)
     return await pcm_to_silk(file, name)
 
 
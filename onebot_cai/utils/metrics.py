@@ -0,0 +1,69 @@
+"""OneBot CAI 运行指标模块"""
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple, Union
+
+Labels = Tuple[Tuple[str, str], ...]
+Number = Union[int, float]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """计数器与仪表盘"""
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, Dict[Labels, Number]] = defaultdict(dict)
+        self.gauges: Dict[str, Dict[Labels, Number]] = defaultdict(dict)
+
+    def inc(self, name: str, value: Number = 1, **labels) -> None:
+        """
+        增加计数器
+
+        name 指标名称
+        value 增加的值
+        labels 标签
+        """
+        key = _labels(labels)
+        counter = self.counters[name]
+        counter[key] = counter.get(key, 0) + value
+
+    def set(self, name: str, value: Number, **labels) -> None:
+        """
+        设置仪表盘
+
+        name 指标名称
+        value 值
+        labels 标签
+        """
+        self.gauges[name][_labels(labels)] = value
+
+    def get(self, name: str, **labels) -> Number:
+        """获取指标当前值，不存在则为 0"""
+        key = _labels(labels)
+        if name in self.gauges:
+            return self.gauges[name].get(key, 0)
+        return self.counters.get(name, {}).get(key, 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """导出全部指标"""
+
+        def _dump(
+            metrics: Dict[str, Dict[Labels, Number]]
+        ) -> Dict[str, List[Dict[str, Any]]]:
+            return {
+                name: [
+                    {"labels": dict(labels), "value": value}
+                    for labels, value in values.items()
+                ]
+                for name, values in metrics.items()
+            }
+
+        return {
+            "counters": _dump(self.counters),
+            "gauges": _dump(self.gauges),
+        }
+
+
+metrics = Metrics()
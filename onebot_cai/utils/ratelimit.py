@@ -0,0 +1,24 @@
+"""OneBot CAI 速率限制模块"""
+import asyncio
+from time import monotonic
+
+
+class RateLimiter:
+    """按固定间隔放行，调用方依次排在上一个放行时间之后"""
+
+    def __init__(self, rate: float):
+        """
+        rate 每秒最多放行的次数，0 表示不限
+        """
+        self.interval = 1 / rate if rate else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        """等待直至可以放行"""
+        if not self.interval:
+            return
+        now = monotonic()
+        at = max(now, self._next)
+        self._next = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
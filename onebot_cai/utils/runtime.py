@@ -1,4 +1,32 @@
 """OneBot CAI 运行时工具模块"""
+from typing import Union
+from importlib.util import find_spec
+
+from ..config.config import Runtime
+
+loop_impl = "asyncio"
+"""事件循环实现"""
+http_impl = "h11"
+"""uvicorn HTTP 解析器实现"""
+
+
+def setup_runtime(runtime: Union[Runtime, str]) -> None:
+    """
+    选择事件循环与 HTTP 解析器，需在创建事件循环前调用
+
+    runtime 运行时
+    """
+    global loop_impl, http_impl
+
+    if Runtime(runtime) != Runtime.AUTO:
+        return
+    if find_spec("uvloop"):
+        import uvloop
+
+        uvloop.install()
+        loop_impl = "uvloop"
+    if find_spec("httptools"):
+        http_impl = "httptools"
 
 
 def seq_to_database_id(seq: int) -> int:
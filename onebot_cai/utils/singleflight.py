@@ -0,0 +1,51 @@
+"""
+OneBot CAI 请求合并模块
+
+启动和重连后，多个应用端可能同时获取相同的好友列表、群列表或群成员列表。
+参数相同的并发调用共用一次执行中的 CAI 请求及其结果。
+"""
+import asyncio
+import inspect
+from functools import wraps
+from typing import Any, Dict, Tuple, TypeVar, Callable, Awaitable
+
+from .metrics import metrics
+
+T = TypeVar("T")
+
+
+def single_flight(
+    func: Callable[..., Awaitable[T]]
+) -> Callable[..., Awaitable[T]]:
+    """
+    合并参数相同的并发调用
+
+    调用方被取消（如动作超时）时不会取消共用的请求，其他调用方仍可得到结果
+    """
+    signature = inspect.signature(func)
+    name = func.__name__
+    in_flight: Dict[Tuple[Any, ...], asyncio.Task] = {}
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs) -> T:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = tuple(bound.arguments.values())
+        metrics.inc("singleflight_calls", function=name)
+        if (task := in_flight.get(key)) is None:
+            task = asyncio.create_task(func(*args, **kwargs))
+            in_flight[key] = task
+
+            def done(_):
+                if in_flight.get(key) is task:
+                    del in_flight[key]
+                # 所有调用方均已取消时避免未获取异常的警告
+                if not task.cancelled():
+                    task.exception()
+
+            task.add_done_callback(done)
+        else:
+            metrics.inc("singleflight_coalesced", function=name)
+        return await asyncio.shield(task)
+
+    return wrapper
@@ -0,0 +1,93 @@
+"""
+OneBot CAI 参数快速校验模块
+
+将动作参数模型预先编译为校验函数：参数类型均已正确时直接构造模型，跳过 pydantic 校验；
+否则交由 pydantic 完整校验（包括类型转换），因此错误信息与 pydantic 完全一致。
+"""
+from typing import (
+    Any,
+    Dict,
+    List,
+    Type,
+    Tuple,
+    Literal,
+    TypeVar,
+    Callable,
+    Optional,
+    get_args,
+    get_origin,
+)
+
+from pydantic import Extra, BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+Check = Callable[[Any], bool]
+
+
+def _is_str_dict(value: Any) -> bool:
+    return type(value) is dict and all(type(key) is str for key in value)
+
+
+def _compile_check(type_: Any) -> Optional[Check]:
+    """编译单个类型的检查函数，不支持的类型返回 None"""
+    if type_ is Any:
+        return lambda _: True
+    if type_ in (int, str, bool):
+        return lambda value: type(value) is type_
+    if type_ is dict:
+        return lambda value: type(value) is dict
+    origin, args = get_origin(type_), get_args(type_)
+    if origin is Literal and all(type(arg) is str for arg in args):
+        values = frozenset(args)
+        return lambda value: type(value) is str and value in values
+    if origin is dict and args == (str, Any):
+        return _is_str_dict
+    if origin is list and len(args) == 1:
+        if (item_check := _compile_check(args[0])) is None:
+            return None
+        return lambda value: type(value) is list and all(
+            map(item_check, value)
+        )
+    return None
+
+
+def compile_validator(model: Type[M]) -> Callable[[Dict[str, Any]], M]:
+    """
+    编译参数模型的校验函数
+
+    model 参数模型，含有自定义校验器、额外字段策略不为忽略或字段类型不受支持时
+    直接使用 pydantic 校验
+    """
+    fallback: Callable[[Dict[str, Any]], M] = lambda values: model(**values)
+    if (
+        model.__config__.extra != Extra.ignore
+        or model.__validators__  # type: ignore
+        or model.__pre_root_validators__  # type: ignore
+        or model.__post_root_validators__  # type: ignore
+    ):
+        return fallback
+
+    fields: List[Tuple[str, Check, bool, bool]] = []
+    for name, field in model.__fields__.items():
+        check = _compile_check(field.outer_type_)
+        if check is None or field.alias != name or field.class_validators:
+            return fallback
+        fields.append((name, check, field.required, field.allow_none))
+
+    def validate(values: Dict[str, Any]) -> M:
+        parsed = {}
+        for name, check, required, allow_none in fields:
+            if name in values:
+                value = values[name]
+                if value is None:
+                    if not allow_none:
+                        return model(**values)
+                elif not check(value):
+                    return model(**values)
+                parsed[name] = value
+            elif required:
+                return model(**values)
+        # 未传入的字段由 construct 填充默认值
+        return model.construct(**parsed)
+
+    return validate
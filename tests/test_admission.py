@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from onebot_cai.utils.admission import AdmissionController
+
+
+@pytest.mark.asyncio
+async def test_cancel_waiter_and_release_in_same_tick():
+    admission = AdmissionController(1, 1, 10)
+    assert await admission.acquire("a") == 0.0
+    waiter = asyncio.create_task(admission.acquire("a"))
+    await asyncio.sleep(0)
+    assert admission.queued == 1
+
+    # 连接断开时排队中与执行中的动作同时被取消
+    waiter.cancel()
+    admission.release("a")
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert admission.running == 0
+    assert admission.queued == 0
+    assert await asyncio.wait_for(admission.acquire("a"), 1) == 0.0
+    admission.release("a")
+    assert admission.running == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_granted_waiter_returns_slot():
+    admission = AdmissionController(1, 1, 10)
+    await admission.acquire("a")
+    waiter = asyncio.create_task(admission.acquire("a"))
+    await asyncio.sleep(0)
+
+    # 名额已分配给等待方，但等待方在恢复执行前被取消
+    admission.release("a")
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert admission.running == 0
+    assert await asyncio.wait_for(admission.acquire("a"), 1) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_weighted_acquire_is_clamped_to_limits():
+    admission = AdmissionController(10, 4, 10)
+    assert await admission.acquire("a", 20) == 0.0
+    assert admission.running == 4
+    waiter = asyncio.create_task(admission.acquire("a"))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    admission.release("a", 20)
+    assert await asyncio.wait_for(waiter, 1) is not None
+    admission.release("a")
+    assert admission.running == 0
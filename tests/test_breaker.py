@@ -0,0 +1,58 @@
+from onebot_cai.utils.breaker import BreakerState, CircuitBreaker
+
+
+def open_breaker(breaker: CircuitBreaker):
+    breaker.trip(34099, "测试")
+    breaker.reset_interval = 0
+
+
+def test_stale_success_does_not_close_breaker():
+    breaker = CircuitBreaker(3, 60000)
+    retcode, token = breaker.allow()
+    assert retcode is None
+
+    # 动作执行期间收到下线事件
+    breaker.trip(34099, "机器人已下线")
+    breaker.record_success(token)
+    assert breaker.state == BreakerState.OPEN
+
+    open_breaker(breaker)
+    retcode, probe = breaker.allow()
+    assert retcode is None and breaker.state == BreakerState.HALF_OPEN
+    breaker.record_success(token)
+    assert breaker.state == BreakerState.HALF_OPEN
+    breaker.record_success(probe)
+    assert breaker.state == BreakerState.CLOSED
+
+
+def test_release_by_non_probe_keeps_single_probe():
+    breaker = CircuitBreaker(3, 60000)
+    _, stale = breaker.allow()
+    open_breaker(breaker)
+
+    retcode, probe = breaker.allow()
+    assert retcode is None
+    assert breaker.allow()[0] == 34099
+
+    breaker.release(stale)
+    assert breaker.allow()[0] == 34099
+
+    breaker.release(probe)
+    retcode, second_probe = breaker.allow()
+    assert retcode is None
+    assert breaker.allow()[0] == 34099
+    breaker.record_success(probe)
+    assert breaker.state == BreakerState.HALF_OPEN
+    breaker.record_failure(second_probe)
+    assert breaker.state == BreakerState.OPEN
+
+
+def test_failures_trip_after_threshold():
+    breaker = CircuitBreaker(2, 60000)
+    _, token = breaker.allow()
+    breaker.record(34000, token)
+    assert breaker.state == BreakerState.CLOSED
+    breaker.record(10003, token)
+    breaker.record(34000, token)
+    assert breaker.state == BreakerState.OPEN
+    assert breaker.allow()[0] == 34000